@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hostel.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'MAIN.urls'
@@ -82,6 +84,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # a file (not in-memory) test database, so concurrent writers wait for the lock like in production
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# shared by the web server, run_worker and management commands, so a version bumped
+# in any of them makes the cached pages stale in all of them
+
+# The test suite clears the cache, so like the database it gets its own directory.
+# It is passed on through the environment so processes started by the tests use it too
+if sys.argv[1:2] == ['test']:
+    os.environ['HOSTEL_CACHE_DIR'] = str(BASE_DIR / 'test_cache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('HOSTEL_CACHE_DIR', BASE_DIR / 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
@@ -130,6 +153,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# uploads waiting for the background worker, such as student import files. They hold
+# personal details, so they live outside MEDIA_ROOT, which is served publicly
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'imports': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': BASE_DIR / 'imports', 'directory_permissions_mode': 0o700, 'file_permissions_mode': 0o600},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
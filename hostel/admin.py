@@ -2,17 +2,36 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 
+
+class DerivedAdmin(admin.ModelAdmin):
+    # Attendance is only written through record_attendance, update_attendance and
+    # delete_attendance_date, which keep the absence streaks and bitmaps in step.
+    # A change made here would skip that, so these rows can be looked at but not edited
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Student)
 admin.site.register(Department)
 admin.site.register(Programme)
-admin.site.register(Allotment)
+admin.site.register(Allotment, list_select_related=('name', 'room_number'))
 admin.site.register(Room)
-admin.site.register(Attendance)
+admin.site.register(Attendance, DerivedAdmin, list_select_related=('name', 'date'))
 admin.site.register(MessBill)
-admin.site.register(StudentBill)
-admin.site.register(AttendanceDate)
-admin.site.register(ContinuousAbsence)
+admin.site.register(StudentBill, list_select_related=('name',))
+admin.site.register(AttendanceDate, DerivedAdmin)
+admin.site.register(ContinuousAbsence, list_select_related=('name',))
 admin.site.register(Trash)
+admin.site.register(AbsenceStreak, DerivedAdmin, list_select_related=('name',))
+admin.site.register(Job)
+admin.site.register(BillSummary, list_select_related=('bill_id',))
+admin.site.register(AttendanceBitmap, DerivedAdmin, list_select_related=('name',))
 
 
 
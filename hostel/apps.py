@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HostelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hostel'
+
+    def ready(self):
+        # register background job handlers and cache invalidation
+        from . import billing, imports, photos, signals
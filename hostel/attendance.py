@@ -0,0 +1,95 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from .models import Attendance, AttendanceDate, Student
+from .caching import attendance_version, bump_attendance_version
+from .locking import take_write_lock
+from .streaks import add_absences, remove_absences
+from .bitmaps import set_absent, clear_absent
+
+# the counters are also keyed by the attendance version, this only bounds their size
+COUNTERS_TIMEOUT = 60 * 60 * 24
+
+
+def record_attendance(day, student_ids):
+    # Writes the date and every absentee in one transaction. The unique date is what
+    # stops two wardens from recording the same day twice, the loser gets a ValueError
+    student_ids = sorted(set(student_ids))
+    try:
+        with transaction.atomic():
+            take_write_lock()
+            attendance_date = AttendanceDate.objects.create(date=day, month=day.strftime('%B'), year=day.year)
+            Attendance.objects.bulk_create([
+                Attendance(date=attendance_date, name_id=student_id) for student_id in student_ids
+            ])
+            add_absences(day, student_ids)
+            set_absent(day, student_ids)
+    except IntegrityError:
+        raise ValueError(f"Attendance has already been recorded for {day}")
+    bump_attendance_version()
+    return attendance_date
+
+
+def delete_attendance_date(attendance_date):
+    with transaction.atomic():
+        take_write_lock()
+        absentee_ids = list(attendance_date.attendance_set.values_list('name_id', flat=True))
+        remove_absences(attendance_date.date, absentee_ids)
+        clear_absent(attendance_date.date, absentee_ids)
+        attendance_date.delete()
+    bump_attendance_version()
+
+
+def update_attendance(attendance_date, student_ids):
+    # Applies only the difference between the stored and the submitted absentees,
+    # and keeps the streak table and bitmaps in step with it
+    day = attendance_date.date
+    student_ids = set(student_ids)
+    with transaction.atomic():
+        take_write_lock()
+        stored = set(Attendance.objects.filter(date=attendance_date).values_list('name_id', flat=True))
+        added = student_ids - stored
+        removed = stored - student_ids
+
+        Attendance.objects.filter(date=attendance_date, name_id__in=removed).delete()
+        Attendance.objects.bulk_create([
+            Attendance(date=attendance_date, name_id=student_id) for student_id in sorted(added)
+        ])
+        remove_absences(day, removed)
+        clear_absent(day, removed)
+        add_absences(day, added)
+        set_absent(day, added)
+    bump_attendance_version()
+    return added, removed
+
+
+def dashboard_counters(today):
+    # Today's present/absent counts and the last recorded date for the attendance
+    # dashboard. Cached under the attendance version, which the attendance writes above
+    # and the signals on Student bump, so roll-call reloads are served from cache
+    key = f'attendance_counters:{today}:{attendance_version()}'
+    counters = cache.get(key)
+    if counters is not None:
+        return counters
+
+    total_students = Student.objects.count()
+    dates = AttendanceDate.objects.annotate(absent=Count('attendance')).values('date', 'absent')
+    last = dates.order_by('-date').first()
+    today_row = last if last and last['date'] == today else dates.filter(date=today).first()
+
+    counters = {
+        'total_students': total_students,
+        'last_date': last['date'] if last else None,
+        'recent_absent': last['absent'] if last else None,
+        'attendance_taken': today_row is not None,
+        'absent_count': None,
+        'present_count': None,
+        'attendance_percentage': None,
+    }
+    if today_row:
+        absent = today_row['absent']
+        counters['absent_count'] = absent
+        counters['present_count'] = total_students - absent
+        counters['attendance_percentage'] = round(((total_students - absent) / total_students) * 100, 2) if total_students > 0 else 0
+    cache.set(key, counters, COUNTERS_TIMEOUT)
+    return counters
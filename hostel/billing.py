@@ -0,0 +1,271 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Coalesce
+from .models import Student, MessBill, StudentBill, ContinuousAbsence, BillSummary, Job, period_of
+from .locking import take_write_lock
+from .jobs import register
+from .caching import attendance_version
+from .streaks import streak_reductions
+
+# extra amount added to the other expenses of students without a streak reduction
+EGRANTZ_SURCHARGE = Decimal(300)
+
+# how long the roster and streak map of a previewed period stay cached
+PREVIEW_TIMEOUT = 60 * 30
+
+
+def compute_bills(student_ids, streak, mess_days, total_mess_amount, room_rent, staff_salary, electricity_bill):
+    # Pure arithmetic over an already loaded roster, returns the mess bill figures
+    # and a list of (student_id, amount) pairs
+    number_of_students = len(student_ids)
+    if number_of_students == 0:
+        raise ValueError("There are no students to bill")
+
+    reduction_days = sum(streak.values())
+    total_mess_days = (mess_days * number_of_students) - reduction_days
+    if total_mess_days <= 0:
+        raise ValueError("No mess days left after streak reductions")
+
+    mess_bill_per_day = total_mess_amount / total_mess_days
+    other_expenses_per_student = ((room_rent * number_of_students) + (staff_salary + electricity_bill)) / number_of_students
+    other_expenses_per_student_4_egrantz = other_expenses_per_student + EGRANTZ_SURCHARGE
+
+    bills = []
+    for student_id in student_ids:
+        if student_id in streak:
+            days_present = mess_days - streak[student_id]
+            mess_bill = round((mess_bill_per_day * days_present) + other_expenses_per_student, 2)
+        else:
+            mess_bill = round((mess_bill_per_day * mess_days) + other_expenses_per_student_4_egrantz, 2)
+        bills.append((student_id, mess_bill))
+
+    summary = {
+        'no_of_students': number_of_students,
+        'mess_days': mess_days,
+        'reduction_days': reduction_days,
+        'total': total_mess_amount + (room_rent * number_of_students) + staff_salary + electricity_bill,
+    }
+    return summary, bills
+
+
+def summarize_bill(messbill, bills, streak, e_grantz_ids):
+    # Per month aggregates shown on the dashboards, built from the in-memory bills
+    e_grantz = [amount for student_id, amount in bills if student_id in e_grantz_ids]
+    others = [amount for student_id, amount in bills if student_id not in e_grantz_ids]
+    return BillSummary(
+        bill_id=messbill,
+        students_total=sum(e_grantz) + sum(others),
+        e_grantz_total=sum(e_grantz),
+        non_e_grantz_total=sum(others),
+        e_grantz_count=len(e_grantz),
+        non_e_grantz_count=len(others),
+        streak_count=len(streak),
+        reduction_days=sum(streak.values()),
+    )
+
+
+def bill_inputs(start_date, end_date):
+    # The expensive, amount independent part of a bill: roster, E-Grantz partition
+    # and streak map. Cached per period and attendance version
+    key = f'bill_inputs:{start_date}:{end_date}:{attendance_version()}'
+    inputs = cache.get(key)
+    if inputs is None:
+        students = list(Student.objects.order_by('id').values_list('id', 'name', 'E_Grantz'))
+        inputs = {
+            'student_ids': [student_id for student_id, name, e_grantz in students],
+            'names': {student_id: name for student_id, name, e_grantz in students},
+            'e_grantz': {student_id for student_id, name, e_grantz in students if e_grantz},
+            'streak': streak_reductions(start_date, end_date),
+        }
+        cache.set(key, inputs, PREVIEW_TIMEOUT)
+    return inputs
+
+
+def preview_bill(start_date, end_date, total_mess_amount, room_rent, staff_salary, electricity_bill):
+    # Dry run of generate_bill, nothing is written
+    inputs = bill_inputs(start_date, end_date)
+    mess_days = (end_date - start_date).days + 1
+    summary, bills = compute_bills(inputs['student_ids'], inputs['streak'], mess_days, total_mess_amount,
+                                   room_rent, staff_salary, electricity_bill)
+
+    true_bills, false_bills = [], []
+    for student_id, amount in bills:
+        row = {
+            'name': inputs['names'][student_id],
+            'streak': inputs['streak'].get(student_id, 0),
+            'total': amount,
+        }
+        (true_bills if student_id in inputs['e_grantz'] else false_bills).append(row)
+
+    summary['month'] = start_date.strftime('%B')
+    summary['year'] = start_date.year
+    summary['sum'] = sum(amount for student_id, amount in bills)
+    return {'summary': summary, 'true_bills': true_bills, 'false_bills': false_bills}
+
+
+def generate_bill(start_date, end_date, total_mess_amount, room_rent, staff_salary, electricity_bill,
+                  progress=None, after_write=None):
+    # Computes every student bill in memory and writes the month in one transaction,
+    # so the number of queries does not depend on the number of students.
+    # progress(stage, percent) is called between stages, after_write(messbill) runs
+    # inside the transaction so callers can commit their own bookkeeping with the bill
+    progress = progress or (lambda stage, percent: None)
+    month = start_date.strftime('%B')
+    year = start_date.year
+    period = period_of(start_date)
+    mess_days = (end_date - start_date).days + 1
+
+    progress('Loading students', 10)
+    students = list(Student.objects.order_by('id').values_list('id', 'E_Grantz'))
+    student_ids = [student_id for student_id, e_grantz in students]
+    e_grantz_ids = {student_id for student_id, e_grantz in students if e_grantz}
+    progress('Finding absence streaks', 30)
+    streak = streak_reductions(start_date, end_date)
+    progress('Calculating bills', 50)
+    summary, bills = compute_bills(student_ids, streak, mess_days, total_mess_amount,
+                                   room_rent, staff_salary, electricity_bill)
+
+    progress('Saving bills', 70)
+    with transaction.atomic():
+        take_write_lock()
+        try:
+            with transaction.atomic():
+                messbill = MessBill.objects.create(
+                    no_of_students=summary['no_of_students'],
+                    month=month,
+                    mess_days=mess_days,
+                    mess_amount=total_mess_amount,
+                    room_rent=room_rent,
+                    staff_salary=staff_salary,
+                    electricity_bill=electricity_bill,
+                    total=summary['total'],
+                    year=year,
+                    start_date=start_date,
+                    end_date=end_date
+                )
+        except IntegrityError:
+            raise ValueError(f"Bill for {month}, {year} already exists")
+        ContinuousAbsence.objects.bulk_create([
+            ContinuousAbsence(bill_id=messbill, name_id=student_id, streak=days_absent, month=month, year=year, period=period)
+            for student_id, days_absent in streak.items()
+        ])
+        StudentBill.objects.bulk_create([
+            StudentBill(bill_id=messbill, name_id=student_id, total=amount, month=month, year=year, period=period,
+                        e_grantz=student_id in e_grantz_ids)
+            for student_id, amount in bills
+        ])
+        summarize_bill(messbill, bills, streak, e_grantz_ids).save()
+        if after_write:
+            after_write(messbill)
+
+    return messbill
+
+
+def billed_e_grantz(bills):
+    # StudentBill rows annotated with the E-Grantz status they were billed with, bills
+    # from before it was stored fall back to the student's current status
+    return bills.annotate(billed_e_grantz=Coalesce('e_grantz', 'name__E_Grantz'))
+
+
+def bill_period(messbill):
+    # Bills generated before the period was stored are assumed to start on the 1st
+    if messbill.start_date and messbill.end_date:
+        return messbill.start_date, messbill.end_date
+    start_date = date(messbill.period // 100, messbill.period % 100, 1)
+    return start_date, start_date + timedelta(days=messbill.mess_days - 1)
+
+
+def plan_recompute(bill_id):
+    # Regenerates one stored month with the current formula in memory, nothing is
+    # written. The roster is the one billed that month, with the E-Grantz status stored
+    # on each bill (the current one for bills from before it was stored), so students
+    # admitted later are left out. Returns the report and what apply_recompute writes
+    messbill = MessBill.objects.get(id=bill_id)
+    start_date, end_date = bill_period(messbill)
+    stored = list(StudentBill.objects.filter(bill_id=messbill).order_by('name_id')
+                  .values_list('name_id', 'total', 'e_grantz', 'name__E_Grantz'))
+    old_bills = {student_id: total for student_id, total, e_grantz, current in stored}
+    student_ids = [student_id for student_id, total, e_grantz, current in stored]
+    e_grantz_ids = {student_id for student_id, total, e_grantz, current in stored
+                    if (current if e_grantz is None else e_grantz)}
+    # E-Grantz students get no reduction, by the status they were billed with
+    streak = {student_id: days for student_id, days in streak_reductions(start_date, end_date, e_grantz=None).items()
+              if student_id in old_bills and student_id not in e_grantz_ids}
+    summary, bills = compute_bills(student_ids, streak, messbill.mess_days, messbill.mess_amount,
+                                   messbill.room_rent, messbill.staff_salary, messbill.electricity_bill)
+    new_bills = dict(bills)
+
+    report = {
+        'bill': str(messbill),
+        'old_total': messbill.total,
+        'new_total': summary['total'],
+        'old_sum': sum(old_bills.values()),
+        'new_sum': sum(new_bills.values()),
+        'changed': sum(1 for student_id in new_bills if old_bills.get(student_id) != new_bills[student_id]),
+    }
+    plan = {
+        'messbill': messbill, 'start_date': start_date, 'end_date': end_date, 'summary': summary,
+        'bills': bills, 'streak': streak, 'e_grantz_ids': e_grantz_ids,
+    }
+    return report, plan
+
+
+def apply_recompute(plan):
+    # Replaces the stored month with a plan from plan_recompute in one transaction
+    messbill, streak, bills, e_grantz_ids = plan['messbill'], plan['streak'], plan['bills'], plan['e_grantz_ids']
+    with transaction.atomic():
+        take_write_lock()
+        MessBill.objects.filter(id=messbill.id).update(
+            no_of_students=plan['summary']['no_of_students'], total=plan['summary']['total'],
+            start_date=plan['start_date'], end_date=plan['end_date'])
+        ContinuousAbsence.objects.filter(bill_id=messbill).delete()
+        StudentBill.objects.filter(bill_id=messbill).delete()
+        BillSummary.objects.filter(bill_id=messbill).delete()
+        ContinuousAbsence.objects.bulk_create([
+            ContinuousAbsence(bill_id=messbill, name_id=student_id, streak=days_absent,
+                              month=messbill.month, year=messbill.year, period=messbill.period)
+            for student_id, days_absent in streak.items()
+        ])
+        StudentBill.objects.bulk_create([
+            StudentBill(bill_id=messbill, name_id=student_id, total=amount,
+                        month=messbill.month, year=messbill.year, period=messbill.period,
+                        e_grantz=student_id in e_grantz_ids)
+            for student_id, amount in bills
+        ])
+        summarize_bill(messbill, bills, streak, e_grantz_ids).save()
+
+
+def recompute_bill(bill_id, dry_run=False):
+    # Recomputes one stored month and reports the difference, everything is read
+    # before the write transaction starts
+    report, plan = plan_recompute(bill_id)
+    if not dry_run:
+        apply_recompute(plan)
+    return report
+
+
+@register('generate_bill')
+def generate_bill_job(job, progress):
+    # A retried job whose bill was already committed only needs to be marked done
+    if job.result and MessBill.objects.filter(id=job.result.get('bill_id')).exists():
+        return job.result
+
+    payload = job.payload
+
+    def save_result(messbill):
+        job.result = {'bill_id': messbill.id, 'month': messbill.month, 'year': messbill.year}
+        Job.objects.filter(id=job.id).update(result=job.result)
+
+    generate_bill(
+        date.fromisoformat(payload['start_date']),
+        date.fromisoformat(payload['end_date']),
+        Decimal(payload['total_mess_amount']),
+        Decimal(payload['room_rent']),
+        Decimal(payload['staff_salary']),
+        Decimal(payload['electricity_bill']),
+        progress=progress,
+        after_write=save_result,
+    )
+    return job.result
@@ -0,0 +1,219 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from .models import Attendance, AttendanceBitmap, AttendanceDate, Student, period_of, period_key
+from .streaks import MIN_STREAK
+from .caching import bump_student_versions, student_version
+from .locking import take_write_lock
+
+# how long a student's calendar stays cached when nothing changes
+CALENDAR_TIMEOUT = 60 * 60 * 24
+
+# Compact attendance store: one AttendanceBitmap row per student and month, kept
+# alongside the Attendance rows. Counts, runs and date lists are bit operations on
+# at most a few integers instead of scans over one row per absence
+
+
+def day_bit(day):
+    return 1 << (day.day - 1)
+
+
+def set_absent(day, student_ids):
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    period = period_of(day)
+    rows = AttendanceBitmap.objects.filter(period=period, name_id__in=student_ids)
+    existing = set(rows.values_list('name_id', flat=True))
+    rows.update(mask=F('mask').bitor(day_bit(day)))
+    AttendanceBitmap.objects.bulk_create([
+        AttendanceBitmap(name_id=student_id, period=period, mask=day_bit(day))
+        for student_id in student_ids - existing
+    ])
+    bump_student_versions(student_ids)
+
+
+def clear_absent(day, student_ids):
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    rows = AttendanceBitmap.objects.filter(period=period_of(day), name_id__in=student_ids)
+    rows.update(mask=F('mask').bitand(~day_bit(day)))
+    rows.filter(mask=0).delete()
+    bump_student_versions(student_ids)
+
+
+def rebuild_bitmaps():
+    masks = defaultdict(int)
+    for student_id, day in Attendance.objects.values_list('name_id', 'date__date').iterator(chunk_size=2000):
+        masks[student_id, period_of(day)] |= day_bit(day)
+    with transaction.atomic():
+        take_write_lock()
+        AttendanceBitmap.objects.all().delete()
+        AttendanceBitmap.objects.bulk_create([
+            AttendanceBitmap(name_id=student_id, period=period, mask=mask)
+            for (student_id, period), mask in masks.items()
+        ], batch_size=500)
+    bump_student_versions(Student.objects.values_list('id', flat=True))
+    return len(masks)
+
+
+def period_start(period):
+    return date(period // 100, period % 100, 1)
+
+
+def timeline(rows, start_date, end_date):
+    # Joins monthly masks into one integer where bit i is start_date + i days
+    bits = 0
+    for period, mask in rows:
+        offset = (period_start(period) - start_date).days
+        bits |= mask << offset if offset >= 0 else mask >> -offset
+    return bits & ((1 << ((end_date - start_date).days + 1)) - 1)
+
+
+def bits_to_days(bits, start_date):
+    days = []
+    while bits:
+        low = bits & -bits
+        days.append(start_date + timedelta(days=low.bit_length() - 1))
+        bits ^= low
+    return days
+
+
+def runs(bits):
+    # lengths of every run of consecutive set bits
+    lengths = []
+    while bits:
+        bits >>= (bits & -bits).bit_length() - 1
+        length = (~bits & (bits + 1)).bit_length() - 1
+        lengths.append(length)
+        bits >>= length
+    return lengths
+
+
+def run_spans(bits, start_date):
+    # (first day, last day) of every run of consecutive set bits
+    spans = []
+    offset = 0
+    while bits:
+        skip = (bits & -bits).bit_length() - 1
+        bits >>= skip
+        offset += skip
+        length = (~bits & (bits + 1)).bit_length() - 1
+        spans.append((start_date + timedelta(days=offset), start_date + timedelta(days=offset + length - 1)))
+        bits >>= length
+        offset += length
+    return spans
+
+
+def longest_run(bits):
+    length = 0
+    while bits:
+        bits &= bits << 1
+        length += 1
+    return length
+
+
+def period_range(start_date, end_date):
+    return (period_of(start_date), period_of(end_date))
+
+
+def student_timeline(student_id, start_date, end_date):
+    rows = AttendanceBitmap.objects.filter(
+        name_id=student_id, period__range=period_range(start_date, end_date)).values_list('period', 'mask')
+    return timeline(rows, start_date, end_date)
+
+
+def absent_dates(student_id, start_date, end_date):
+    return bits_to_days(student_timeline(student_id, start_date, end_date), start_date)
+
+
+def absent_count(student_id, start_date, end_date):
+    return student_timeline(student_id, start_date, end_date).bit_count()
+
+
+def student_longest_run(student_id, start_date, end_date):
+    return longest_run(student_timeline(student_id, start_date, end_date))
+
+
+def all_absent_dates(student_id):
+    # every recorded absence of one student, oldest first
+    days = []
+    for period, mask in AttendanceBitmap.objects.filter(name_id=student_id).order_by('period').values_list('period', 'mask'):
+        start = period_start(period)
+        days += bits_to_days(mask, start)
+    return days
+
+
+def find_continuous_absences(start_date, end_date):
+    # Same result as streaks.find_continuous_absences, computed from the bitmaps
+    rows = (AttendanceBitmap.objects
+            .filter(period__range=period_range(start_date, end_date), name__E_Grantz=False)
+            .order_by('name_id').values_list('name_id', 'period', 'mask'))
+    per_student = defaultdict(list)
+    for student_id, period, mask in rows:
+        per_student[student_id].append((period, mask))
+
+    reductions = {}
+    for student_id, months in per_student.items():
+        days = sum(length for length in runs(timeline(months, start_date, end_date)) if length >= MIN_STREAK)
+        if days:
+            reductions[student_id] = days
+    return reductions
+
+
+def percentage(absent, recorded):
+    return round((recorded - absent) / recorded * 100, 2) if recorded else None
+
+
+def student_calendar(student_id, year):
+    # One year of a student's attendance for the heatmap: absent days, counts and
+    # percentage per month, and absence runs (clipped to the year). Recorded days and
+    # the student's mask come from one query grouped by month, and the result is
+    # cached until the student's absences or the recorded dates change
+    key = f'student_calendar:{student_id}:{year}:{student_version(student_id)}'
+    calendar = cache.get(key)
+    if calendar is not None:
+        return calendar
+
+    masks = AttendanceBitmap.objects.filter(name_id=student_id, period=OuterRef('period')).values('mask')
+    rows = (AttendanceDate.objects
+            .filter(period__range=(period_key(year, 1), period_key(year, 12)))
+            .values('period')
+            .annotate(recorded=Count('id'), mask=Subquery(masks))
+            .order_by('period'))
+
+    months = []
+    monthly_masks = []
+    for row in rows:
+        mask = row['mask'] or 0
+        monthly_masks.append((row['period'], mask))
+        absent = mask.bit_count()
+        months.append({
+            'month': period_start(row['period']).strftime('%B'),
+            'period': row['period'],
+            'recorded_days': row['recorded'],
+            'absent_days': absent,
+            'attendance_percentage': percentage(absent, row['recorded']),
+            'absent': [day.day for day in bits_to_days(mask, period_start(row['period']))],
+        })
+
+    start_date, end_date = date(year, 1, 1), date(year, 12, 31)
+    bits = timeline(monthly_masks, start_date, end_date)
+    recorded = sum(month['recorded_days'] for month in months)
+    calendar = {
+        'year': year,
+        'months': months,
+        'recorded_days': recorded,
+        'absent_days': bits.bit_count(),
+        'attendance_percentage': percentage(bits.bit_count(), recorded),
+        'streaks': [
+            {'start': start, 'end': end, 'length': (end - start).days + 1,
+             'reduces_bill': (end - start).days + 1 >= MIN_STREAK}
+            for start, end in run_spans(bits, start_date)
+        ],
+    }
+    cache.set(key, calendar, CALENDAR_TIMEOUT)
+    return calendar
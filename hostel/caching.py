@@ -0,0 +1,60 @@
+import uuid
+from django.core.cache import cache
+
+# Everything derived from attendance or the roster is cached under the current
+# attendance version, bumping the version makes all of it stale at once. The cache
+# is shared between processes (see CACHES), so bumps from run_worker and management
+# commands reach the web server too
+
+VERSION_KEY = 'attendance_version'
+
+
+def new_version():
+    # a fresh token instead of a counter, so a version that was evicted or cleared
+    # never comes back as a value something was cached under before
+    return uuid.uuid4().hex[:16]
+
+
+def version(key):
+    return cache.get_or_set(key, new_version, None)
+
+
+def attendance_version():
+    return version(VERSION_KEY)
+
+
+def bump_attendance_version():
+    bump(VERSION_KEY)
+
+
+# Per-student data such as the attendance calendar is cached under that student's
+# version and the dates version, so marking one student absent leaves the others cached
+
+DATES_VERSION_KEY = 'dates_version'
+STUDENT_VERSION_KEY = 'student_version:{}'
+
+# students share this many versions, a whole-roster bump writes at most this many keys
+STUDENT_VERSION_BUCKETS = 64
+
+
+def bump(key):
+    cache.set(key, new_version(), None)
+
+
+def bump_dates_version():
+    bump(DATES_VERSION_KEY)
+
+
+def student_version_key(student_id):
+    return STUDENT_VERSION_KEY.format(student_id % STUDENT_VERSION_BUCKETS)
+
+
+def bump_student_versions(student_ids):
+    keys = {student_version_key(student_id) for student_id in student_ids}
+    cache.set_many({key: new_version() for key in keys}, None)
+
+
+def student_version(student_id):
+    dates = version(DATES_VERSION_KEY)
+    student = version(student_version_key(student_id))
+    return f'{dates}.{student}'
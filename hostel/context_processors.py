@@ -2,8 +2,10 @@ from django.contrib.auth.models import User
 
 def group_processor(request):
     if request.user.is_authenticated:
-        is_warden_group = request.user.groups.filter(name='warden').exists()
-        is_secretary_group = request.user.groups.filter(name='secretary').exists()  # Adjust as needed
+        # one query for both groups, this runs on every page
+        groups = set(request.user.groups.filter(name__in=['warden', 'secretary']).values_list('name', flat=True))
+        is_warden_group = 'warden' in groups
+        is_secretary_group = 'secretary' in groups  # Adjust as needed
     else:
         is_warden_group = False
         is_secretary_group = False
@@ -5,4 +5,12 @@ def group_required(group_name,login_url=None):
         if user.is_authenticated:
             return user.groups.filter(name=group_name).exists()
         return False
-    return user_passes_test(in_group, login_url=login_url)
\ No newline at end of file
+    return user_passes_test(in_group, login_url=login_url)
+
+def query_budget(queries):
+    # The most queries a view may run per request, whatever the number of rows it
+    # shows. QueryBudgetMiddleware logs the requests that go over it
+    def decorator(view_func):
+        view_func.query_budget = queries
+        return view_func
+    return decorator
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Sum
+from django.utils.timezone import localtime
+from .models import Allotment, Room
+from .attendance import dashboard_counters
+from .caching import attendance_version
+
+# Live dashboard counters over Server-Sent Events. Every change to students,
+# attendance, rooms or allotments bumps the attendance version (see signals), so a
+# stream only has to watch that one cache key and push a fresh snapshot when it moves.
+# No broker is involved, the version lives in the cache every process shares (CACHES).
+# counter_events serves ASGI, counter_events_sync serves WSGI (runserver, MAIN/wsgi.py),
+# where an async iterator would be collected whole before anything is sent. Under
+# WSGI each open dashboard holds a server thread for the life of its stream
+
+# seconds between version checks, between keep-alive comments, and before the
+# stream ends and the browser's EventSource reconnects
+POLL_INTERVAL = 1
+KEEPALIVE = 15
+STREAM_LIFETIME = 60 * 5
+
+COUNTERS_TIMEOUT = 60 * 60 * 24
+
+
+def room_counters():
+    key = f'room_counters:{attendance_version()}'
+    counters = cache.get(key)
+    if counters is None:
+        rooms = Room.objects.aggregate(total_rooms=Count('id'), total_capacity=Sum('capacity'))
+        total_capacity = rooms['total_capacity'] or 0
+        allotted = Allotment.objects.count()
+        counters = {
+            'total_rooms': rooms['total_rooms'],
+            'total_capacity': total_capacity,
+            'allotted': allotted,
+            'available_slots': total_capacity - allotted,
+            'occupancy': round(allotted / total_capacity * 100, 2) if total_capacity else 0,
+        }
+        cache.set(key, counters, COUNTERS_TIMEOUT)
+    return counters
+
+
+def snapshot():
+    return {'attendance': dashboard_counters(localtime().date()), 'rooms': room_counters()}
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def counter_events():
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_LIFETIME
+    last_sent = loop.time()
+    version = None
+    yield 'retry: 3000\n\n'
+    while loop.time() < deadline:
+        current = await sync_to_async(attendance_version)()
+        if current != version:
+            version = current
+            yield sse('counters', await sync_to_async(snapshot)())
+            last_sent = loop.time()
+        elif loop.time() - last_sent >= KEEPALIVE:
+            yield ': keep-alive\n\n'
+            last_sent = loop.time()
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def counter_events_sync():
+    deadline = time.monotonic() + STREAM_LIFETIME
+    last_sent = time.monotonic()
+    version = None
+    yield 'retry: 3000\n\n'
+    while time.monotonic() < deadline:
+        current = attendance_version()
+        if current != version:
+            version = current
+            yield sse('counters', snapshot())
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= KEEPALIVE:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(POLL_INTERVAL)
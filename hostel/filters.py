@@ -1,33 +1,55 @@
 import django_filters
+from django.db.models import F
 from django.forms.widgets import DateInput
 from .models import *
 
+class PeriodFilterSet(django_filters.FilterSet):
+    # month and year are matched through the indexed integer period key
+    month = django_filters.ChoiceFilter(choices=MONTH_CHOICES, method='filter_period')
+    year = django_filters.NumberFilter(method='filter_period')
+
+    def filter_period(self, queryset, name, value):
+        # both fields are handled together in filter_queryset
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        month = self.form.cleaned_data.get('month')
+        year = self.form.cleaned_data.get('year')
+        if month and year is not None:
+            return queryset.filter(period=period_key(year, month))
+        if year is not None:
+            return queryset.filter(period__range=(period_key(year, 1), period_key(year, 12)))
+        if month:
+            return queryset.alias(month_number=F('period') % 100).filter(month_number=MONTH_NUMBERS[month])
+        return queryset
+
 class studentFilter(django_filters.FilterSet):
     class Meta:
         model = Student
         exclude = ['name','admn_no','dob','email','photo','contact','parent_name','parent_occupation','address','annual_income','status','date_joined','date_exited']
 
-class billFilter(django_filters.FilterSet):
+class billFilter(PeriodFilterSet):
     class Meta:
         model = StudentBill
-        exclude = ['bill_id','total']
+        fields = ['name','month','year']
 
 class roomFilter(django_filters.FilterSet):
     class Meta:
         model = Allotment
         fields = ['room_number']
 
-class streakFilter(django_filters.FilterSet):
+class streakFilter(PeriodFilterSet):
     class Meta:
         model = ContinuousAbsence
         fields = ['name','month','year']
 
-class monthbillFilter(django_filters.FilterSet):
+class monthbillFilter(PeriodFilterSet):
     class Meta:
         model = MessBill
         fields = ['month','year']
 
-class attendanceFilter(django_filters.FilterSet):
+class attendanceFilter(PeriodFilterSet):
     class Meta:
         model = AttendanceDate
-        fields = ['month','year']
\ No newline at end of file
+        fields = ['month','year']
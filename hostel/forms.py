@@ -1,6 +1,8 @@
+import zipfile
 from django import forms
 from .models import *
 from django.core.exceptions import ValidationError
+from .imaging import check_pixels
 
 
 class StudentForm(forms.ModelForm):
@@ -19,6 +21,17 @@ class StudentForm(forms.ModelForm):
             'dob': 'Date of Birth',
             'contact': 'Contact Number',
         }
+
+    def clean_photo(self):
+        # the image field has already read the header, refuse huge photos before the worker decodes them
+        photo = self.cleaned_data.get('photo')
+        image = getattr(photo, 'image', None)
+        if image is not None:
+            try:
+                check_pixels(image)
+            except ValueError as e:
+                raise ValidationError(str(e))
+        return photo
     
 class AllotementForm(forms.ModelForm):
     class Meta:
@@ -51,15 +64,56 @@ class BillForm(forms.Form):
         return cleaned_data
 
 
+class StudentIdsField(forms.Field):
+    # A list of student ids packed into one comma separated hidden input, the
+    # checkboxes are drawn client side from the roster endpoint
+    widget = forms.HiddenInput
+
+    def prepare_value(self, value):
+        if isinstance(value, (list, tuple, set)):
+            return ','.join(str(student_id) for student_id in sorted(value))
+        return value
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return sorted({int(student_id) for student_id in value.split(',') if student_id.strip()})
+        except ValueError:
+            raise ValidationError("Invalid list of students.")
+
+    def validate(self, value):
+        super().validate(value)
+        unknown = set(value) - set(Student.objects.filter(id__in=value).values_list('id', flat=True))
+        if unknown:
+            raise ValidationError("Some of the selected students no longer exist.")
+
+
 class AttendanceForm(forms.Form):
     date = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date'}),
         label='Date'
         )
 
-    absentees = forms.ModelMultipleChoiceField(
-        queryset=Student.objects.all().order_by('name'),
-        required=False,
-        widget=forms.CheckboxSelectMultiple,
-        label='Students'
-        )
+    absentees = StudentIdsField(required=False, label='Students')
+
+
+class EditAttendanceForm(AttendanceForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['date'].disabled = True
+
+
+class AttendanceImportForm(forms.Form):
+    file = forms.FileField(label='CSV or JSONL file', help_text='One absence per line: date (YYYY-MM-DD) and admn_no')
+
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(label='CSV file', help_text='admn_no, name, programme, dob (YYYY-MM-DD), email, contact and optionally category, e_grantz, photo')
+    photos = forms.FileField(label='Photos (zip)', required=False, help_text='Each photo named after the admission number or the photo column')
+
+    def clean_photos(self):
+        photos = self.cleaned_data.get('photos')
+        if photos and not zipfile.is_zipfile(photos):
+            raise ValidationError("The photos should be a zip file.")
+        return photos
@@ -0,0 +1,282 @@
+import csv
+import json
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import PurePosixPath
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage, storages
+from django.db import transaction
+from .locking import take_write_lock
+from .models import Attendance, AttendanceDate, Programme, Student, period_of
+from .streaks import rebuild_streaks
+from .bitmaps import rebuild_bitmaps
+from .caching import bump_attendance_version
+from .jobs import register
+from .imaging import try_render_photo
+from .photos import store_photo
+from .search import index_people
+
+# absences written per bulk_create, two parameters each keeps it under SQLite's limit
+IMPORT_CHUNK = 400
+
+# students validated, photographed and written together, small enough that a
+# batch of photo bytes sits comfortably in memory
+STUDENT_CHUNK = 100
+
+# processes rendering the photos of a student import
+PHOTO_WORKERS = 4
+
+# largest photo read from an archive, anything bigger is not a phone photo
+MAX_PHOTO_BYTES = 30 * 2**20
+
+STUDENT_COLUMNS = {'admn_no', 'name', 'programme', 'dob', 'email', 'contact'}
+
+
+def read_records(lines, fmt):
+    # Yields (line_number, record) without reading the whole file, a record is a dict
+    # with 'date' and 'admn_no', or None when the line could not be parsed
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    elif fmt == 'csv':
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or not {'date', 'admn_no'} <= set(reader.fieldnames):
+            raise ValueError("The CSV file needs a 'date,admn_no' header")
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'")
+
+
+def import_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+
+def import_attendance(lines, fmt, chunk_size=IMPORT_CHUNK):
+    # Loads historical absences in fixed-size chunks inside one transaction. Lines that
+    # name an unknown student, a bad date or an absence already stored are rejected and
+    # reported, everything else is written. Streaks and bitmaps are rebuilt once at the end
+    students = dict(Student.objects.values_list('admn_no', 'id'))
+    dates = dict(AttendanceDate.objects.values_list('date', 'id'))
+    seen = set()
+    loaded_dates = set()
+    new_dates = {}
+    pending = []
+    rejected = []
+    report = {'dates': 0, 'absences': 0, 'rejected': rejected}
+
+    def flush():
+        AttendanceDate.objects.bulk_create(new_dates.values())
+        for day, attendance_date in new_dates.items():
+            dates[day] = attendance_date.id
+            loaded_dates.add(day)
+        report['dates'] += len(new_dates)
+        new_dates.clear()
+        Attendance.objects.bulk_create([
+            Attendance(date_id=dates[day], name_id=student_id) for day, student_id in pending
+        ])
+        report['absences'] += len(pending)
+        pending.clear()
+
+    with transaction.atomic():
+        take_write_lock()
+        for line_number, record in read_records(lines, fmt):
+            if record is None:
+                rejected.append((line_number, "Could not read the line"))
+                continue
+            try:
+                day = date.fromisoformat(str(record.get('date', '')).strip())
+            except ValueError:
+                rejected.append((line_number, f"Invalid date '{record.get('date')}'"))
+                continue
+            try:
+                student_id = students[int(str(record.get('admn_no', '')).strip())]
+            except (KeyError, ValueError):
+                rejected.append((line_number, f"Unknown admission number '{record.get('admn_no')}'"))
+                continue
+
+            if day in dates and day not in loaded_dates:
+                # absences already stored for an existing date count as duplicates
+                seen.update((day, stored_id) for stored_id in
+                            Attendance.objects.filter(date_id=dates[day]).values_list('name_id', flat=True))
+                loaded_dates.add(day)
+            if (day, student_id) in seen:
+                rejected.append((line_number, f"Absence on {day} is already recorded"))
+                continue
+            seen.add((day, student_id))
+
+            if day not in dates and day not in new_dates:
+                new_dates[day] = AttendanceDate(date=day, month=day.strftime('%B'), year=day.year, period=period_of(day))
+            pending.append((day, student_id))
+            if len(pending) >= chunk_size:
+                flush()
+        flush()
+
+        if report['absences']:
+            rebuild_streaks()
+            rebuild_bitmaps()
+    return report
+
+
+def parse_yes_no(value):
+    value = (value or 'no').strip().lower()
+    if value in ('yes', 'y', 'true', '1'):
+        return True
+    if value in ('no', 'n', 'false', '0'):
+        return False
+    raise ValueError(f"E_Grantz should be yes or no, not '{value}'")
+
+
+def read_student(record, programmes):
+    # A validated, unsaved Student built from one CSV row, field checks need no queries
+    programme = programmes.get((record.get('programme') or '').strip().lower())
+    if programme is None:
+        raise ValueError(f"Unknown programme '{record.get('programme')}'")
+    student = Student(
+        admn_no=(record.get('admn_no') or '').strip(),
+        name=(record.get('name') or '').strip(),
+        pgm=programme,
+        dob=(record.get('dob') or '').strip(),
+        email=(record.get('email') or '').strip(),
+        contact=(record.get('contact') or '').strip(),
+        category=(record.get('category') or 'GENERAL').strip().upper(),
+        E_Grantz=parse_yes_no(record.get('e_grantz')),
+    )
+    try:
+        student.clean_fields(exclude=['pgm', 'photo'])
+    except ValidationError as e:
+        raise ValueError('; '.join(f"{field}: {' '.join(errors)}" for field, errors in e.message_dict.items()))
+    return student
+
+
+def archive_photos(archive):
+    # zip member names by file name and by file name without extension
+    members = {}
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        path = PurePosixPath(info.filename)
+        members.setdefault(path.name.lower(), info)
+        members.setdefault(path.stem.lower(), info)
+    return members
+
+
+def import_students(lines, archive=None, workers=None, progress=None, storage=None):
+    # Onboards a batch of students from a CSV (admn_no,name,programme,dob,email,contact
+    # and optionally category, e_grantz, photo) and a zip of their photos. Rows are
+    # checked against admission numbers and programmes loaded once, photos are
+    # rendered in a process pool and each chunk is written in its own transaction.
+    # A photo is taken from the photo column or named after the admission number
+    progress = progress or (lambda stage, percent: None)
+    storage = storage or default_storage
+    workers = workers or PHOTO_WORKERS
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or not STUDENT_COLUMNS <= set(reader.fieldnames):
+        raise ValueError(f"The CSV file needs the columns {', '.join(sorted(STUDENT_COLUMNS))}")
+
+    existing = set(Student.objects.values_list('admn_no', flat=True))
+    programmes = {pgm.pgm_name.lower(): pgm for pgm in Programme.objects.select_related('dept_id')}
+    members = archive_photos(archive) if archive else {}
+    rejected = []
+    photo_errors = []
+    report = {'students': 0, 'photos': 0, 'rejected': rejected, 'photo_errors': photo_errors}
+
+    progress('Checking students', 5)
+    valid = []
+    for record in reader:
+        line_number = reader.line_num
+        try:
+            student = read_student(record, programmes)
+        except ValueError as e:
+            rejected.append((line_number, str(e)))
+            continue
+        if student.admn_no in existing:
+            rejected.append((line_number, f"Admission number {student.admn_no} already exists"))
+            continue
+        photo = (record.get('photo') or '').strip()
+        member = members.get(photo.lower() or str(student.admn_no))
+        if photo and member is None:
+            rejected.append((line_number, f"Photo '{photo}' is not in the archive"))
+            continue
+        existing.add(student.admn_no)
+        valid.append((line_number, student, member))
+
+    pool = None
+    if workers > 1 and any(member for line_number, student, member in valid):
+        # spawned rather than forked, the children only import Pillow code and never
+        # inherit the parent's database connection, even in the middle of a transaction
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for start in range(0, len(valid), STUDENT_CHUNK):
+            chunk = valid[start:start + STUDENT_CHUNK]
+            progress(f"Adding students {start + 1}-{start + len(chunk)} of {len(valid)}",
+                     10 + 85 * start // len(valid))
+            with_photos = [(student, member) for line_number, student, member in chunk if member]
+            stored = add_photos(with_photos, archive, pool, photo_errors, storage)
+            students = [student for line_number, student, member in chunk]
+            try:
+                with transaction.atomic():
+                    take_write_lock()
+                    Student.objects.bulk_create(students)
+                    index_people(Student, students, created=True)
+            except Exception:
+                # the rows were rolled back, their photos would be left pointing at nothing
+                for name in stored:
+                    storage.delete(name)
+                raise
+            report['photos'] += len(stored)
+            report['students'] += len(students)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if report['students']:
+        bump_attendance_version()
+    return report
+
+
+def add_photos(with_photos, archive, pool, photo_errors, storage):
+    # Renders and stores the photos of one chunk and returns the stored names, a photo
+    # that fails leaves its student without one
+    blobs = []
+    for student, member in with_photos:
+        blobs.append(archive.read(member) if member.file_size <= MAX_PHOTO_BYTES else None)
+    rendered = list((pool.map if pool else map)(try_render_photo, blobs))
+    stored = []
+    for (student, member), (result, error) in zip(with_photos, rendered):
+        if error:
+            photo_errors.append((student.admn_no, f"{member.filename}: {error}"))
+            continue
+        student.photo, student.photo_hash = store_photo(result, f'images/{student.admn_no}.webp', storage)
+        student.photo_status = Student.PHOTO_READY
+        stored.append(student.photo.name)
+    return stored
+
+
+@register('import_students')
+def import_students_job(job, progress):
+    # The uploads were saved to the private imports storage by the view, they are
+    # removed once imported
+    payload = job.payload
+    storage = storages['imports']
+    try:
+        with storage.open(payload['csv']) as raw:
+            lines = (line.decode('utf-8-sig') for line in raw)
+            if payload.get('photos'):
+                with storage.open(payload['photos']) as photos, zipfile.ZipFile(photos) as archive:
+                    report = import_students(lines, archive, progress=progress)
+            else:
+                report = import_students(lines, progress=progress)
+    finally:
+        for name in (payload['csv'], payload.get('photos')):
+            if name:
+                storage.delete(name)
+    return report
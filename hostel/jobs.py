@@ -0,0 +1,75 @@
+import traceback
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import Job
+from .locking import take_write_lock
+
+# A local job queue stored in the Job table, drained by `manage.py run_worker`
+
+HANDLERS = {}
+
+# a running job without a heartbeat for this long belongs to a dead worker
+STALE_AFTER = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def register(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, **payload):
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def report(job, stage, progress):
+    job.stage = stage
+    job.progress = progress
+    Job.objects.filter(id=job.id).update(stage=stage, progress=progress, heartbeat=timezone.now())
+
+
+def claim_next():
+    # Takes the oldest queued job, the status check in the update keeps two workers
+    # from claiming the same row
+    while True:
+        job = Job.objects.filter(status='queued').order_by('id').first()
+        if job is None:
+            return None
+        claimed = Job.objects.filter(id=job.id, status='queued').update(
+            status='running', attempts=job.attempts + 1, heartbeat=timezone.now())
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job):
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job kind '{job.kind}'")
+        result = handler(job, lambda stage, progress: report(job, stage, progress))
+    except Exception:
+        Job.objects.filter(id=job.id).update(status='failed', error=traceback.format_exc(), finished_at=timezone.now())
+    else:
+        if result is None:
+            # the handler may have stored its result together with its own writes
+            result = Job.objects.values_list('result', flat=True).get(id=job.id)
+        Job.objects.filter(id=job.id).update(status='done', stage='Done', progress=100, result=result, finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
+
+
+def recover_stale():
+    # Jobs left running by a dead worker are queued again, their writes were rolled
+    # back with the worker's transaction
+    cutoff = timezone.now() - STALE_AFTER
+    stale = Job.objects.filter(status='running', heartbeat__lt=cutoff)
+    with transaction.atomic():
+        take_write_lock()
+        failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+            status='failed', error="Worker stopped while running this job", finished_at=timezone.now())
+        requeued = stale.update(status='queued', stage='', progress=0)
+    return requeued, failed
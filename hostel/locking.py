@@ -0,0 +1,14 @@
+from datetime import date
+from .models import AttendanceDate
+
+# Every write transaction starts with take_write_lock(), so writers queue up on
+# SQLite's lock instead of failing halfway through
+
+
+def take_write_lock():
+    # Called first inside transaction.atomic(). SQLite starts a transaction without a lock
+    # and only asks for the write lock at its first write, which fails at once if a reader
+    # holding a snapshot has to be upgraded while another writer is busy. An update that
+    # matches no row is enough to take the lock up front, like BEGIN IMMEDIATE, which
+    # Django can only issue from 5.1 on (the transaction_mode option)
+    AttendanceDate.objects.filter(date=date.min).update(year=0)
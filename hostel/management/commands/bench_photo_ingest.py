@@ -0,0 +1,73 @@
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import django
+from django.core.management.base import BaseCommand
+from PIL import Image
+from hostel.imaging import PHOTO_SIZES, crop_box, encode_webp, render_photo
+
+
+def init_worker():
+    django.setup()
+
+
+def peak_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def ingest(path, full_decode):
+    # One upload in a fresh process, returns the peak RSS before and after
+    before = peak_rss()
+    with open(path, 'rb') as file:
+        if full_decode:
+            # what Student.save used to do: decode, convert and crop at full resolution
+            img = Image.open(file).convert('RGB')
+            img = img.crop(crop_box(img.size))
+            encode_webp(img)
+            for width in PHOTO_SIZES.values():
+                variant = img.copy()
+                variant.thumbnail((width, width * 2))
+                encode_webp(variant)
+        else:
+            render_photo(file.read())
+    return before, peak_rss()
+
+
+def make_input(directory, megapixels, fmt):
+    width = int((megapixels * 10**6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient.rotate(180)))
+    path = Path(directory) / f'{megapixels}mp.{fmt.lower()}'
+    img.save(path, format=fmt)
+    return path, f'{width}x{height}'
+
+
+class Command(BaseCommand):
+    help = "Measure the peak memory of processing one large photo upload"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megapixels', type=int, nargs='+', default=[12, 24, 48])
+        parser.add_argument('--formats', nargs='+', default=['JPEG', 'PNG'],
+                            help="Pillow formats to generate, HEIC needs a plugin Pillow does not ship with")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Input':<22}{'Full decode MB':>16}{'Bounded MB':>12}")
+        with tempfile.TemporaryDirectory() as directory:
+            for fmt in options['formats']:
+                for megapixels in options['megapixels']:
+                    path, size = make_input(directory, megapixels, fmt)
+                    row = []
+                    for full_decode in (True, False):
+                        # a new process per run so each peak is measured on its own
+                        with ProcessPoolExecutor(max_workers=1, initializer=init_worker) as pool:
+                            try:
+                                before, after = pool.submit(ingest, path, full_decode).result()
+                            except ValueError:
+                                # over the pixel cap for its format
+                                row.append('refused')
+                                continue
+                        row.append(f'{(after - before) / 1024:.0f}')
+                    self.stdout.write(f"{fmt + ' ' + size:<22}{row[0]:>16}{row[1]:>12}")
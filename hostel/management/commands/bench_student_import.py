@@ -0,0 +1,70 @@
+import tempfile
+import time
+import zipfile
+from io import BytesIO, StringIO
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+from hostel.imports import import_students
+from hostel.models import Programme, Student
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_batch(count, first_admn_no, programme, megapixels):
+    # A CSV and a zip holding one JPEG per student, every photo differs so none are
+    # deduplicated by their hash
+    width = int((megapixels * 10**6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient.rotate(180)))
+    lines = ['admn_no,name,programme,dob,email,contact,category,e_grantz,photo']
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w') as photos:
+        for i in range(count):
+            admn_no = first_admn_no + i
+            lines.append(f'{admn_no},Bench {i},{programme},2005-01-01,bench{i}@example.com,9876543210,GENERAL,no,')
+            img.putpixel((i % width, i // width % height), (255, 0, 0))
+            data = BytesIO()
+            img.save(data, format='JPEG', quality=90)
+            photos.writestr(f'{admn_no}.jpg', data.getvalue())
+    archive.seek(0)
+    return '\n'.join(lines) + '\n', archive
+
+
+class Command(BaseCommand):
+    help = "Time a bulk student import with photos, nothing is kept"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--megapixels', type=int, default=2)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+
+    def handle(self, *args, **options):
+        programme = Programme.objects.first()
+        if programme is None:
+            raise CommandError("Add a programme first, the imported students need one")
+        first_admn_no = (Student.objects.aggregate(last=Max('admn_no'))['last'] or 0) + 1
+        self.stdout.write(f"Generating {options['students']} students with {options['megapixels']} MP photos")
+        csv_text, archive = make_batch(options['students'], first_admn_no, programme.pgm_name, options['megapixels'])
+
+        self.stdout.write(f"{'Workers':<10}{'Seconds':>10}{'Students/s':>12}")
+        for workers in options['workers']:
+            with tempfile.TemporaryDirectory() as directory:
+                started = time.perf_counter()
+                try:
+                    # the students are rolled back and the photos land in a temporary directory
+                    with transaction.atomic():
+                        report = import_students(StringIO(csv_text), zipfile.ZipFile(archive), workers=workers,
+                                                 storage=FileSystemStorage(location=directory))
+                        elapsed = time.perf_counter() - started
+                        raise Rollback
+                except Rollback:
+                    pass
+            if report['rejected'] or report['photos'] != options['students']:
+                raise CommandError(f"Import was incomplete: {report['rejected'][:3]} {report['photo_errors'][:3]}")
+            self.stdout.write(f"{workers:<10}{elapsed:>10.1f}{options['students'] / elapsed:>12.1f}")
@@ -0,0 +1,33 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from hostel.models import Student, Trash
+from hostel.photos import build_variants, prune_variants
+
+
+class Command(BaseCommand):
+    help = "Write the resized copies of existing student photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help="Also delete copies no student uses any more")
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for model in (Student, Trash):
+            people = model.objects.exclude(photo='').exclude(photo__isnull=True).only('photo', 'photo_hash')
+            if model is Student:
+                # uploads still waiting for the worker get their copies from it
+                people = people.exclude(photo_status=Student.PHOTO_PROCESSING)
+            for person in people.iterator():
+                try:
+                    digest = build_variants(person)
+                except Exception as e:
+                    self.stderr.write(f"{model.__name__} {person.id}: {e}")
+                    failed += 1
+                    continue
+                if digest != person.photo_hash:
+                    model.objects.filter(id=person.id, photo=person.photo.name).update(photo_hash=digest)
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built photo sizes for {built} students, {failed} failed"))
+        if options['prune']:
+            self.stdout.write(f"Removed {prune_variants(default_storage)} unused files")
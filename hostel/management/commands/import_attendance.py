@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from hostel.imports import import_attendance, import_format
+
+
+class Command(BaseCommand):
+    help = "Import historical absences from a CSV (date,admn_no) or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file of absences")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, newline='', encoding='utf-8') as lines:
+                report = import_attendance(lines, options['format'] or import_format(path))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line_number, reason in report['rejected']:
+            self.stderr.write(f"Line {line_number}: {reason}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['absences']} absences over {report['dates']} new dates, "
+            f"rejected {len(report['rejected'])} lines"
+        ))
@@ -0,0 +1,32 @@
+import zipfile
+from django.core.management.base import BaseCommand, CommandError
+from hostel.imports import PHOTO_WORKERS, import_students
+
+
+class Command(BaseCommand):
+    help = "Add a batch of students from a CSV file and an optional zip of their photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with admn_no,name,programme,dob,email,contact columns")
+        parser.add_argument('--photos', help="Zip of photos named after the admission number or the photo column")
+        parser.add_argument('--workers', type=int, default=PHOTO_WORKERS, help="Number of photos processed in parallel")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as lines:
+                if options['photos']:
+                    with zipfile.ZipFile(options['photos']) as archive:
+                        report = import_students(lines, archive, options['workers'])
+                else:
+                    report = import_students(lines, workers=options['workers'])
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            raise CommandError(str(e))
+
+        for line_number, reason in report['rejected']:
+            self.stderr.write(f"Line {line_number}: {reason}")
+        for admn_no, reason in report['photo_errors']:
+            self.stderr.write(f"Photo of {admn_no}: {reason}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {report['students']} students with {report['photos']} photos, "
+            f"rejected {len(report['rejected'])} lines"
+        ))
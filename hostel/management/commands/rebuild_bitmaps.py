@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from hostel.bitmaps import rebuild_bitmaps
+
+
+class Command(BaseCommand):
+    help = "Recompute the monthly attendance bitmaps from the raw attendance records"
+
+    def handle(self, *args, **options):
+        count = rebuild_bitmaps()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} attendance bitmaps"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from hostel.search import fts_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Recompute the full-text search index of active and archived students"
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write("The search index needs SQLite with FTS5, searches use icontains instead")
+            return
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} students"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from hostel.streaks import rebuild_streaks
+
+
+class Command(BaseCommand):
+    help = "Recompute the absence streak table from the raw attendance records"
+
+    def handle(self, *args, **options):
+        count = rebuild_streaks()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} absence streaks"))
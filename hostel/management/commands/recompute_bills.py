@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from hostel.billing import apply_recompute, plan_recompute
+from hostel.models import MessBill, period_of
+
+
+def init_worker():
+    # every process opens its own database connection, and only reads with it
+    django.setup()
+    connections.close_all()
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise CommandError(f"Month '{value}' should look like 2024-05")
+
+
+class Command(BaseCommand):
+    help = "Recompute stored mess bills for a range of months and report the differences"
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help="First month, e.g. 2024-01")
+        parser.add_argument('end', nargs='?', help="Last month, defaults to the first one")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Number of months read and computed in parallel, the writes are made one month at a time")
+        parser.add_argument('--dry-run', action='store_true', help="Only report, do not rewrite the bills")
+
+    def handle(self, *args, **options):
+        start = parse_month(options['start'])
+        end = parse_month(options['end'] or options['start'])
+
+        bill_ids = list(MessBill.objects.filter(period__range=(period_of(start), period_of(end)))
+                        .order_by('period').values_list('id', flat=True))
+        if not bill_ids:
+            raise CommandError("No bills found in that range")
+
+        dry_run = options['dry_run']
+        if options['workers'] > 1 and len(bill_ids) > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                plans = list(pool.map(plan_recompute, bill_ids))
+        else:
+            plans = [plan_recompute(bill_id) for bill_id in bill_ids]
+        # SQLite has a single writer, so the months are written here one after another
+        # once every worker is done reading
+        if not dry_run:
+            for report, plan in plans:
+                apply_recompute(plan)
+        reports = [report for report, plan in plans]
+
+        self.stdout.write(f"{'Bill':<16}{'Stored total':>14}{'New total':>14}{'Stored sum':>14}{'New sum':>14}{'Changed':>9}")
+        for report in reports:
+            self.stdout.write(
+                f"{report['bill']:<16}{report['old_total']:>14}{report['new_total']:>14}"
+                f"{report['old_sum']:>14}{report['new_sum']:>14}{report['changed']:>9}"
+            )
+        action = "Checked" if dry_run else "Recomputed"
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(reports)} bills"))
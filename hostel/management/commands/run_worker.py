@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from hostel.jobs import claim_next, run_job, recover_stale
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs such as mess bill generation and photo processing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+        parser.add_argument('--sleep', type=float, default=2, help="Seconds to wait between polls of an empty queue")
+
+    def handle(self, *args, **options):
+        requeued, failed = recover_stale()
+        if requeued or failed:
+            self.stdout.write(f"Recovered stale jobs: {requeued} queued again, {failed} failed")
+
+        while True:
+            job = claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                recover_stale()
+                continue
+
+            self.stdout.write(f"Running {job}")
+            job = run_job(job)
+            if job.status == 'done':
+                self.stdout.write(self.style.SUCCESS(f"Finished {job}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Failed {job}"))
@@ -0,0 +1,51 @@
+import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    # Counts the queries of views decorated with query_budget and warns when a request
+    # goes over, which is how an N+1 in a template shows up before the table is large.
+    # It runs in either mode, so async views such as dashboard_events are not switched to sync
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        self.check_budget(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = await self.get_response(request)
+        self.check_budget(request, counter)
+        return response
+
+    def check_budget(self, request, counter):
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and counter.count > budget:
+            logger.warning("%s ran %d queries, its budget is %d", request.path, counter.count, budget)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def build_streaks(apps, schema_editor):
+    Attendance = apps.get_model('hostel', 'Attendance')
+    AbsenceStreak = apps.get_model('hostel', 'AbsenceStreak')
+    runs = []
+    current = None
+    for student_id, day in Attendance.objects.order_by('name_id', 'date__date').values_list('name_id', 'date__date').iterator():
+        if current and current.name_id == student_id and day == current.last_date + timedelta(days=1):
+            current.last_date = day
+            current.length += 1
+        else:
+            current = AbsenceStreak(name_id=student_id, start_date=day, last_date=day, length=1)
+            runs.append(current)
+    AbsenceStreak.objects.bulk_create(runs, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0004_remove_department_dept_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbsenceStreak',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('length', models.PositiveIntegerField()),
+                ('name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hostel.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'last_date'], name='hostel_abse_name_id_c0c83e_idx'), models.Index(fields=['last_date', 'start_date'], name='hostel_abse_last_da_f96373_idx')],
+            },
+        ),
+        migrations.RunPython(build_streaks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messbill',
+            name='end_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messbill',
+            name='start_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
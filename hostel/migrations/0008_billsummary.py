@@ -0,0 +1,58 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_summaries(apps, schema_editor):
+    MessBill = apps.get_model('hostel', 'MessBill')
+    BillSummary = apps.get_model('hostel', 'BillSummary')
+    bills = MessBill.objects.annotate(
+        e_grantz_total=Sum('studentbill__total', filter=Q(studentbill__name__E_Grantz=True), default=0),
+        non_e_grantz_total=Sum('studentbill__total', filter=Q(studentbill__name__E_Grantz=False), default=0),
+        e_grantz_count=Count('studentbill', filter=Q(studentbill__name__E_Grantz=True)),
+        non_e_grantz_count=Count('studentbill', filter=Q(studentbill__name__E_Grantz=False)),
+    )
+    streaks = dict(MessBill.objects.annotate(
+        streak_count=Count('continuousabsence')).values_list('id', 'streak_count'))
+    reductions = dict(MessBill.objects.annotate(
+        reduction_days=Sum('continuousabsence__streak', default=0)).values_list('id', 'reduction_days'))
+    BillSummary.objects.bulk_create([
+        BillSummary(
+            bill_id_id=bill.id,
+            students_total=bill.e_grantz_total + bill.non_e_grantz_total,
+            e_grantz_total=bill.e_grantz_total,
+            non_e_grantz_total=bill.non_e_grantz_total,
+            e_grantz_count=bill.e_grantz_count,
+            non_e_grantz_count=bill.non_e_grantz_count,
+            streak_count=streaks[bill.id],
+            reduction_days=reductions[bill.id],
+        )
+        for bill in bills
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0007_messbill_period_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('students_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('e_grantz_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('non_e_grantz_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('e_grantz_count', models.PositiveIntegerField()),
+                ('non_e_grantz_count', models.PositiveIntegerField()),
+                ('streak_count', models.PositiveIntegerField()),
+                ('reduction_days', models.PositiveIntegerField()),
+                ('bill_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='hostel.messbill')),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
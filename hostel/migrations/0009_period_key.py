@@ -0,0 +1,84 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:26
+
+from django.db import migrations, models
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+
+def fill_periods(apps, schema_editor):
+    for model_name in ['AttendanceDate', 'MessBill', 'StudentBill', 'ContinuousAbsence']:
+        model = apps.get_model('hostel', model_name)
+        for number, month in enumerate(MONTHS, 1):
+            model.objects.filter(month=month).update(period=models.F('year') * 100 + number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0008_billsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancedate',
+            name='period',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='messbill',
+            name='period',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='studentbill',
+            name='period',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='continuousabsence',
+            name='period',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_periods, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='attendancedate',
+            name='period',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='messbill',
+            name='period',
+            field=models.PositiveIntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='studentbill',
+            name='period',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='continuousabsence',
+            name='period',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='attendancedate',
+            index=models.Index(fields=['period', 'date'], name='hostel_atte_period_554b94_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='continuousabsence',
+            index=models.Index(fields=['period', 'name'], name='hostel_cont_period_0a8530_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='continuousabsence',
+            index=models.Index(fields=['name', 'period'], name='hostel_cont_name_id_237886_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentbill',
+            index=models.Index(fields=['period', 'name'], name='hostel_stud_period_a9e201_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentbill',
+            index=models.Index(fields=['name', 'period'], name='hostel_stud_name_id_223e50_idx'),
+        ),
+    ]
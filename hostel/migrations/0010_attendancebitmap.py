@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:29
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def build_bitmaps(apps, schema_editor):
+    Attendance = apps.get_model('hostel', 'Attendance')
+    AttendanceBitmap = apps.get_model('hostel', 'AttendanceBitmap')
+    masks = defaultdict(int)
+    for student_id, day in Attendance.objects.values_list('name_id', 'date__date').iterator():
+        masks[student_id, day.year * 100 + day.month] |= 1 << (day.day - 1)
+    AttendanceBitmap.objects.bulk_create([
+        AttendanceBitmap(name_id=student_id, period=period, mask=mask)
+        for (student_id, period), mask in masks.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0009_period_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.PositiveIntegerField()),
+                ('mask', models.PositiveIntegerField(default=0)),
+                ('name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hostel.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'name'], name='hostel_atte_period_397e33_idx')],
+                'unique_together': {('name', 'period')},
+            },
+        ),
+        migrations.RunPython(build_bitmaps, migrations.RunPython.noop),
+    ]
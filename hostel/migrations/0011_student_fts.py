@@ -0,0 +1,41 @@
+from django.db import migrations
+
+FTS_TABLE = 'hostel_student_fts'
+
+INDEX_SQL = f"""
+INSERT INTO {FTS_TABLE} (kind, ref, name, admn_no, email, programme, department)
+SELECT %s, person.id, person.name, person.admn_no, person.email, pgm.pgm_name, dept.dept_name
+FROM {{table}} person
+JOIN hostel_programme pgm ON pgm.id = person.pgm_id
+JOIN hostel_department dept ON dept.id = pgm.dept_id_id
+"""
+
+
+def create_index(apps, schema_editor):
+    # FTS5 is SQLite only, other databases keep searching with icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            kind UNINDEXED, ref UNINDEXED, name, admn_no, email, programme, department,
+            tokenize = 'unicode61', prefix = '2 3'
+        )
+    """)
+    schema_editor.execute(INDEX_SQL.format(table='hostel_student'), ['student'])
+    schema_editor.execute(INDEX_SQL.format(table='hostel_trash'), ['archived'])
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0010_attendancebitmap'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
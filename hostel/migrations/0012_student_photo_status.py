@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0011_student_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='photo_status',
+            field=models.CharField(blank=True, choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], editable=False, max_length=10),
+        ),
+    ]
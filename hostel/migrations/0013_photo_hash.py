@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0012_student_photo_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='photo_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='trash',
+            name='photo_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0013_photo_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentbill',
+            name='e_grantz',
+            field=models.BooleanField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+FTS_TABLE = 'hostel_student_fts'
+
+# rowid = id * 2 + 0 for students and + 1 for archived students, see search.fts_rowid
+INDEX_SQL = f"""
+INSERT INTO {FTS_TABLE} (rowid, kind, ref, name, admn_no, email, programme, department)
+SELECT person.id * 2 + %s, %s, person.id, person.name, person.admn_no, person.email, pgm.pgm_name, dept.dept_name
+FROM {{table}} person
+JOIN hostel_programme pgm ON pgm.id = person.pgm_id
+JOIN hostel_department dept ON dept.id = pgm.dept_id_id
+"""
+
+
+def reindex(apps, schema_editor):
+    # the rows were inserted with automatic rowids, they are written again with
+    # rowids derived from the kind and id so updates can find them without a scan
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DELETE FROM {FTS_TABLE}")
+    schema_editor.execute(INDEX_SQL.format(table='hostel_student'), [0, 'student'])
+    schema_editor.execute(INDEX_SQL.format(table='hostel_trash'), [1, 'archived'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0014_studentbill_e_grantz'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex, migrations.RunPython.noop),
+    ]
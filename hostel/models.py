@@ -1,12 +1,43 @@
 from django.db import models
 from django.core.validators import RegexValidator
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
-import os
 
 # Create your models here.
 
+MONTH_CHOICES = [
+    ('January', 'January'),
+    ('February', 'February'),
+    ('March', 'March'),
+    ('April', 'April'),
+    ('May', 'May'),
+    ('June', 'June'),
+    ('July', 'July'),
+    ('August', 'August'),
+    ('September', 'September'),
+    ('October', 'October'),
+    ('November', 'November'),
+    ('December', 'December'),
+]
+MONTH_NUMBERS = {name: number for number, (name, label) in enumerate(MONTH_CHOICES, 1)}
+
+
+def period_key(year, month):
+    # month may be a number or a month name, e.g. period_key(2024, 'May') == 202405
+    if not isinstance(month, int):
+        month = MONTH_NUMBERS[month]
+    return int(year) * 100 + month
+
+
+def period_of(day):
+    return period_key(day.year, day.month)
+
+
+class PeriodMixin:
+    # fills the integer period key from the month name and year on save
+    def save(self, *args, **kwargs):
+        self.period = period_key(self.year, self.month)
+        super().save(*args, **kwargs)
+
+
 class Department(models.Model):
     dept_name = models.CharField(max_length=100,unique=True)
 
@@ -46,54 +77,29 @@ class Student(models.Model):
     ]
     E_Grantz = models.BooleanField(choices=EGRANTZ_CHOICES)
     
-    def save(self, *args, **kwargs):
-        # Keep reference of uploaded photo
-        original_photo = self.photo
+    PHOTO_PROCESSING = 'processing'
+    PHOTO_READY = 'ready'
+    PHOTO_FAILED = 'failed'
+    PHOTO_STATUS_CHOICES = [
+        (PHOTO_PROCESSING, 'Processing'),
+        (PHOTO_READY, 'Ready'),
+        (PHOTO_FAILED, 'Failed'),
+    ]
+    photo_status = models.CharField(max_length=10, choices=PHOTO_STATUS_CHOICES, blank=True, editable=False)
+    # content hash naming the resized copies of the photo, see photos.photo_url
+    photo_hash = models.CharField(max_length=16, blank=True, editable=False)
 
-        # Save first to make sure file exists on disk
+    def save(self, *args, **kwargs):
+        # A new upload is stored as it is and queued for the background worker, which
+        # crops it to 3:4, converts it to WebP and points the row at the result
+        new_upload = bool(self.photo) and not self.photo._committed
+        if new_upload:
+            self.photo_status = self.PHOTO_PROCESSING
+            self.photo_hash = ''
         super().save(*args, **kwargs)
-
-        if original_photo and self.photo:  
-            photo_path = self.photo.path
-            if os.path.exists(photo_path):   
-                img = Image.open(photo_path)
-
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                # Maintain 3:4 ratio
-                desired_ratio = 3 / 4
-                width, height = img.size
-                current_ratio = width / height
-
-                if current_ratio > desired_ratio:
-                    new_width = int(height * desired_ratio)
-                    left = (width - new_width) / 2
-                    right = left + new_width
-                    img = img.crop((left, 0, right, height))
-                elif current_ratio < desired_ratio:
-                    new_height = int(width / desired_ratio)
-                    top = (height - new_height) / 2
-                    bottom = top + new_height
-                    img = img.crop((0, top, width, bottom))
-
-                # Save as WebP
-                buffer = BytesIO()
-                img.save(buffer, format='WEBP', quality=85)
-                webp_filename = os.path.splitext(original_photo.name)[0] + ".webp"
-
-                # Replace file in DB
-                self.photo.save(webp_filename, ContentFile(buffer.getvalue()), save=False)
-
-                # Delete original (non-WebP) file if still exists
-                original_path = original_photo.path
-                if os.path.exists(original_path) and not original_path.endswith(".webp"):
-                    os.remove(original_path)
-
-                # Final save to update DB with WebP image
-                super().save(*args, **kwargs)
-
-
+        if new_upload:
+            from .jobs import enqueue
+            enqueue('process_photo', student_id=self.id, name=self.photo.name)
 
     def __str__(self):
         return self.name
@@ -125,6 +131,7 @@ class Trash(models.Model):
         (False, 'No'),
     ]
     E_Grantz = models.BooleanField(choices=EGRANTZ_CHOICES)
+    photo_hash = models.CharField(max_length=16, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -151,24 +158,14 @@ class Allotment(models.Model):
             raise ValueError("Room capacity exceeded")
         super().save(*args, **kwargs)
 
-class AttendanceDate(models.Model):
+class AttendanceDate(PeriodMixin, models.Model):
     date = models.DateField(unique=True)
-    MONTH_CHOICES = [
-        ('January', 'January'),
-        ('February', 'February'),
-        ('March', 'March'),
-        ('April', 'April'),
-        ('May', 'May'),
-        ('June', 'June'),
-        ('July', 'July'),
-        ('August', 'August'),
-        ('September', 'September'),
-        ('October', 'October'),
-        ('November', 'November'),
-        ('December', 'December'),
-    ]
     month = models.CharField(max_length=10,choices=MONTH_CHOICES)
     year = models.IntegerField()
+    period = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['period','date'])]
 
     def __str__(self):
         return str(self.date)
@@ -183,22 +180,8 @@ class Attendance(models.Model):
         return f"{self.name.name} was absent on {self.date.date}"
 
 
-class MessBill(models.Model):
+class MessBill(PeriodMixin, models.Model):
     no_of_students = models.SmallIntegerField()
-    MONTH_CHOICES = [
-        ('January', 'January'),
-        ('February', 'February'),
-        ('March', 'March'),
-        ('April', 'April'),
-        ('May', 'May'),
-        ('June', 'June'),
-        ('July', 'July'),
-        ('August', 'August'),
-        ('September', 'September'),
-        ('October', 'October'),
-        ('November', 'November'),
-        ('December', 'December'),
-    ]
     month = models.CharField(max_length=42,choices=MONTH_CHOICES)
     mess_days = models.SmallIntegerField()
     mess_amount = models.DecimalField(max_digits=10,decimal_places=2)
@@ -207,6 +190,9 @@ class MessBill(models.Model):
     electricity_bill = models.DecimalField(max_digits=10,decimal_places=2)
     total = models.DecimalField(max_digits=10,decimal_places=2)
     year = models.SmallIntegerField()
+    start_date = models.DateField(null=True,blank=True)
+    end_date = models.DateField(null=True,blank=True)
+    period = models.PositiveIntegerField(unique=True)
 
     class Meta:
         unique_together = ['month','year']
@@ -214,56 +200,108 @@ class MessBill(models.Model):
     def __str__(self):
         return f"{self.month}-{self.year}"
 
-class StudentBill(models.Model):
+class BillSummary(models.Model):
+    bill_id = models.OneToOneField(MessBill,on_delete=models.CASCADE,related_name='summary')
+    students_total = models.DecimalField(max_digits=12,decimal_places=2)
+    e_grantz_total = models.DecimalField(max_digits=12,decimal_places=2)
+    non_e_grantz_total = models.DecimalField(max_digits=12,decimal_places=2)
+    e_grantz_count = models.PositiveIntegerField()
+    non_e_grantz_count = models.PositiveIntegerField()
+    streak_count = models.PositiveIntegerField()
+    reduction_days = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Summary of {self.bill_id}"
+
+class StudentBill(PeriodMixin, models.Model):
     bill_id = models.ForeignKey(MessBill,on_delete=models.CASCADE)
     name = models.ForeignKey(Student,on_delete=models.CASCADE)
     total = models.DecimalField(max_digits=10,decimal_places=2)
-    MONTH_CHOICES = [
-        ('January', 'January'),
-        ('February', 'February'),
-        ('March', 'March'),
-        ('April', 'April'),
-        ('May', 'May'),
-        ('June', 'June'),
-        ('July', 'July'),
-        ('August', 'August'),
-        ('September', 'September'),
-        ('October', 'October'),
-        ('November', 'November'),
-        ('December', 'December'),
-    ]
     month = models.CharField(max_length=20,choices=MONTH_CHOICES)
     year = models.SmallIntegerField()
+    period = models.PositiveIntegerField()
+    # E-Grantz status when the bill was generated, empty for bills from before it was kept
+    e_grantz = models.BooleanField(null=True, editable=False)
 
     class Meta:
         unique_together = ['name','month','year']
+        indexes = [
+            models.Index(fields=['period','name']),
+            models.Index(fields=['name','period']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.month}"
     
-class ContinuousAbsence(models.Model):
+class ContinuousAbsence(PeriodMixin, models.Model):
     bill_id = models.ForeignKey(MessBill,on_delete=models.CASCADE)
     name = models.ForeignKey(Student,on_delete=models.CASCADE)
     streak = models.IntegerField()
-    MONTH_CHOICES = [
-        ('January', 'January'),
-        ('February', 'February'),
-        ('March', 'March'),
-        ('April', 'April'),
-        ('May', 'May'),
-        ('June', 'June'),
-        ('July', 'July'),
-        ('August', 'August'),
-        ('September', 'September'),
-        ('October', 'October'),
-        ('November', 'November'),
-        ('December', 'December'),
-    ]
     month = models.CharField(max_length=20,choices=MONTH_CHOICES)
     year = models.IntegerField()
+    period = models.PositiveIntegerField()
 
     class Meta:
         unique_together =  ['name','month','year']
+        indexes = [
+            models.Index(fields=['period','name']),
+            models.Index(fields=['name','period']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} for {self.streak} days"
+
+class AbsenceStreak(models.Model):
+    name = models.ForeignKey(Student,on_delete=models.CASCADE)
+    start_date = models.DateField()
+    last_date = models.DateField()
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name','last_date']),
+            models.Index(fields=['last_date','start_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} absent from {self.start_date} to {self.last_date}"
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'queued'),
+        ('running', 'running'),
+        ('done', 'done'),
+        ('failed', 'failed'),
+    ]
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=100, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status','id'])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class AttendanceBitmap(models.Model):
+    # bit (day - 1) of mask is set when the student was absent on that day of the month
+    name = models.ForeignKey(Student,on_delete=models.CASCADE)
+    period = models.PositiveIntegerField()
+    mask = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['name','period']
+        indexes = [models.Index(fields=['period','name'])]
 
     def __str__(self):
-        return f"{self.name} for {self.streak} days"
\ No newline at end of file
+        return f"{self.name} - {self.period}"
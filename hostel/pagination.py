@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from .caching import attendance_version
+
+# Keyset (cursor) pagination: a page is "the next N rows after this ordering key",
+# so it costs the same at page 1 and page 1000 and needs no COUNT(*) or OFFSET
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def after(ordering, values):
+    # Rows strictly after `values` in `ordering`, e.g. for (a, -b):
+    # a > va OR (a = va AND b < vb)
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+# page totals are only for orientation, so they may lag behind by this many seconds
+# for tables that do not bump the attendance version
+COUNT_TIMEOUT = 60
+
+PAGE_PARAMS = ('after', 'before', 'last', 'page')
+
+
+def cached_count(queryset, timeout=COUNT_TIMEOUT):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    return cache.get_or_set(f'count:{digest}:{attendance_version()}', queryset.count, timeout)
+
+
+def query_params(request):
+    # the current filters, without the paging parameters, for building page links
+    params = request.GET.copy()
+    for name in PAGE_PARAMS:
+        params.pop(name, None)
+    return params
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, paginator=None):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    # ordering must end with a unique field (usually 'id') so the order is stable,
+    # and the ordering fields must not be nullable
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+
+    @property
+    def count(self):
+        return cached_count(self.queryset)
+
+    def key(self, obj):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(obj, dict):
+                value = obj[name]
+            else:
+                value = obj
+                for part in name.split('__'):
+                    value = getattr(value, part)
+            values.append(value.pk if hasattr(value, '_meta') else value)
+        return values
+
+    def get_page(self, after_cursor=None, before_cursor=None, last=False):
+        # last=True reads the final page backwards from the end of the ordering
+        backwards = (bool(before_cursor) or last) and not after_cursor
+        cursor = before_cursor if backwards else after_cursor
+        values = decode_cursor(cursor) if cursor else None
+        if values is not None and len(values) != len(self.ordering):
+            values = None
+
+        ordering = reverse_ordering(self.ordering) if backwards else self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(after(ordering, values))
+
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = values is not None, more
+        else:
+            has_next, has_previous = more, values is not None
+
+        next_cursor = encode_cursor(self.key(rows[-1])) if rows and has_next else None
+        previous_cursor = encode_cursor(self.key(rows[0])) if rows and has_previous else None
+        return KeysetPage(rows, has_next, has_previous, next_cursor, previous_cursor, self)
+
+    def get_page_from_request(self, request):
+        return self.get_page(request.GET.get('after'), request.GET.get('before'), bool(request.GET.get('last')))
@@ -0,0 +1,99 @@
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from .imaging import PHOTO_SIZES, STORED_WIDTH, content_hash, open_photo, render_photo, render_variants
+from .jobs import register
+from .models import Student, Trash
+
+# Student photos are stored as uploaded and processed by the background worker:
+# cropped to 3:4, scaled down and re-encoded to WebP, then the row is pointed at the new file.
+# The worker also writes resized copies named after a hash of the photo, so a
+# copy never changes once written and can be cached by browsers for good
+
+VARIANT_DIR = 'photos'
+
+
+def variant_name(digest, size):
+    return f'{digest}-{size}.webp'
+
+
+def save_variants(digest, variants, storage):
+    # Writes the copies that are missing, the same photo always gives the same names
+    for size, data in variants.items():
+        name = f'{VARIANT_DIR}/{variant_name(digest, size)}'
+        if not storage.exists(name):
+            storage.save(name, ContentFile(data))
+
+
+def store_photo(rendered, name, storage):
+    # Saves the output of render_photo, returns the stored name and the hash
+    webp, digest, variants = rendered
+    save_variants(digest, variants, storage)
+    return storage.save(name, ContentFile(webp)), digest
+
+
+def build_variants(person):
+    # Resized copies of an already processed photo, returns the hash naming them
+    storage = person.photo.storage
+    with storage.open(person.photo.name) as file:
+        data = file.read()
+    digest = content_hash(data)
+    if not all(storage.exists(f'{VARIANT_DIR}/{variant_name(digest, size)}') for size in PHOTO_SIZES):
+        save_variants(digest, render_variants(open_photo(BytesIO(data))), storage)
+    return digest
+
+
+def prune_variants(storage):
+    # Deletes copies no student or archived student points at any more
+    if not storage.exists(VARIANT_DIR):
+        return 0
+    in_use = set(Student.objects.exclude(photo_hash='').values_list('photo_hash', flat=True))
+    in_use.update(Trash.objects.exclude(photo_hash='').values_list('photo_hash', flat=True))
+    removed = 0
+    for name in storage.listdir(VARIANT_DIR)[1]:
+        if name.split('-')[0] not in in_use:
+            storage.delete(f'{VARIANT_DIR}/{name}')
+            removed += 1
+    return removed
+
+
+def photo_url(person, size):
+    # The resized copy when there is one, the stored photo otherwise
+    if not person.photo:
+        return None
+    if person.photo_hash:
+        return reverse('photo_variant', args=[variant_name(person.photo_hash, size)])
+    return person.photo.url
+
+
+@register('process_photo')
+def process_photo_job(job, progress):
+    student_id, raw_name = job.payload['student_id'], job.payload['name']
+    student = Student.objects.filter(id=student_id).first()
+    if student is None or student.photo.name != raw_name:
+        # the student was removed or uploaded another photo since, that upload has its own job.
+        # The upload is deleted unless an archived student still points at it
+        if not Trash.objects.filter(photo=raw_name).exists():
+            Student._meta.get_field('photo').storage.delete(raw_name)
+        return {'skipped': True}
+
+    try:
+        progress('Processing photo', 30)
+        storage = student.photo.storage
+        with storage.open(raw_name) as file:
+            rendered = render_photo(file.read())
+        progress('Saving photo', 60)
+        webp_name, digest = store_photo(rendered, os.path.splitext(raw_name)[0] + '.webp', storage)
+    except Exception:
+        Student.objects.filter(id=student_id, photo=raw_name).update(photo_status=Student.PHOTO_FAILED)
+        raise
+
+    # only switch if the row still points at the upload this job was queued for
+    updated = Student.objects.filter(id=student_id, photo=raw_name).update(
+        photo=webp_name, photo_hash=digest, photo_status=Student.PHOTO_READY)
+    if updated:
+        storage.delete(raw_name)
+    else:
+        storage.delete(webp_name)
+    return {'photo': webp_name if updated else None}
@@ -0,0 +1,140 @@
+import re
+from django.db import connection
+from .models import Student, Trash
+
+# Full-text index over active and archived students in one SQLite FTS5 table. Each
+# row is tagged with its kind and the id of the Student or Trash row it describes,
+# and its rowid is derived from both (see fts_rowid), so it is found without a scan.
+# Signals keep it in step with save and delete, bulk writes call index_people or
+# rebuild_search_index. The table is created by migration 0011 on SQLite, on other
+# databases search falls back to icontains
+
+FTS_TABLE = 'hostel_student_fts'
+STUDENT = 'student'
+ARCHIVED = 'archived'
+KINDS = {STUDENT: Student, ARCHIVED: Trash}
+
+# kind and ref are UNINDEXED columns, looking a row up by them scans the whole table.
+# Both kinds share the rowid space, one even and one odd
+KIND_BITS = {STUDENT: 0, ARCHIVED: 1}
+
+# most results returned for one search, they are ranked so the rest rarely matter
+SEARCH_LIMIT = 100
+
+# weights of the indexed columns in the ranking, a name match counts most
+RANK = f"bm25({FTS_TABLE}, 0, 0, 10, 5, 2, 1, 1)"
+
+_available = {}
+
+
+def fts_available():
+    # looked up once per database, the table only comes and goes with migrations
+    name = str(connection.settings_dict['NAME'])
+    if name not in _available:
+        _available[name] = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _available[name]
+
+
+def kind_of(model):
+    return ARCHIVED if model is Trash else STUDENT
+
+
+def fts_rowid(kind, ref):
+    return ref * 2 + KIND_BITS[kind]
+
+
+def index_people(model, people, created=False):
+    # (Re)indexes Student or Trash rows, their programme and department must be loaded.
+    # created=True skips removing the old entries, for rows that were just inserted
+    if not fts_available():
+        return
+    kind = kind_of(model)
+    people = list(people)
+    rows = [
+        (fts_rowid(kind, person.id), kind, person.id, person.name, str(person.admn_no), person.email,
+         person.pgm.pgm_name, person.pgm.dept_id.dept_name)
+        for person in people
+    ]
+    with connection.cursor() as cursor:
+        if not created:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                               [(fts_rowid(kind, person.id),) for person in people])
+        cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, kind, ref, name, admn_no, email, programme, department) "
+                           f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", rows)
+
+
+def unindex(model, ids):
+    if not fts_available():
+        return
+    kind = kind_of(model)
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(fts_rowid(kind, ref),) for ref in ids])
+
+
+def rebuild_search_index():
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    for model in KINDS.values():
+        people = model.objects.select_related('pgm__dept_id').only(
+            'name', 'admn_no', 'email', 'pgm__pgm_name', 'pgm__dept_id__dept_name')
+        index_people(model, people.iterator(chunk_size=2000), created=True)
+        count += people.count()
+    return count
+
+
+def match_expression(query):
+    # Every word must match as a prefix, e.g. 'ann phy' -> "ann"* AND "phy"*.
+    # Words are quoted so FTS5 operators typed by the user are taken literally
+    words = re.findall(r'\w+', query)
+    return ' AND '.join(f'"{word}"*' for word in words)
+
+
+def search(query, kinds=(STUDENT, ARCHIVED), limit=SEARCH_LIMIT):
+    # Returns [(kind, id)] best match first
+    expression = match_expression(query)
+    if not expression:
+        return []
+    placeholders = ', '.join(['%s'] * len(kinds))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT kind, ref FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND kind IN ({placeholders}) "
+            f"ORDER BY {RANK} LIMIT %s",
+            [expression, *kinds, limit])
+        return [(kind, int(ref)) for kind, ref in cursor.fetchall()]
+
+
+def filtered_matches(model, queryset, expression, select, tail='', params=()):
+    # FTS rows of one kind matching the expression whose ref is in the filtered
+    # queryset, the filter runs inside the query so LIMIT only counts rows it keeps
+    ids_sql, ids_params = queryset.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {select} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND kind = %s "
+            f"AND ref IN ({ids_sql}) {tail}",
+            [expression, kind_of(model), *ids_params, *params])
+        return cursor.fetchall()
+
+
+def search_people(model, queryset, query, limit=SEARCH_LIMIT):
+    # Ranked matches of one model within an already filtered queryset
+    if not fts_available():
+        return list(queryset.filter(name__icontains=query)[:limit])
+    expression = match_expression(query)
+    if not expression:
+        return []
+    ids = [int(ref) for ref, in filtered_matches(model, queryset, expression, 'ref', f"ORDER BY {RANK} LIMIT %s", [limit])]
+    found = queryset.in_bulk(ids)
+    return [found[ref] for ref in ids if ref in found]
+
+
+def count_people(model, queryset, query):
+    # All matches within the filtered queryset, search_people returns at most SEARCH_LIMIT
+    if not fts_available():
+        return queryset.filter(name__icontains=query).count()
+    expression = match_expression(query)
+    if not expression:
+        return 0
+    return filtered_matches(model, queryset, expression, 'COUNT(*)')[0][0]
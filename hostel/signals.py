@@ -0,0 +1,44 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Department, Programme, Student, Trash, Room, Allotment, AttendanceDate
+from .caching import bump_attendance_version, bump_dates_version
+from .search import index_people, unindex
+
+
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Room)
+@receiver([post_save, post_delete], sender=Allotment)
+def attendance_changed(sender, **kwargs):
+    # Attendance and AttendanceDate are left out on purpose: a receiver on Attendance
+    # makes Django delete its rows one signal at a time instead of in one query, and
+    # attendance.py and the import bump the version once per operation
+    bump_attendance_version()
+
+
+@receiver([post_save, post_delete], sender=AttendanceDate)
+def dates_changed(sender, **kwargs):
+    # the number of recorded days is the denominator of every student's percentage
+    bump_dates_version()
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Trash)
+def person_saved(sender, instance, created, **kwargs):
+    index_people(sender, [instance], created=created)
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Trash)
+def person_deleted(sender, instance, **kwargs):
+    unindex(sender, [instance.id])
+
+
+@receiver(post_save, sender=Programme)
+@receiver(post_save, sender=Department)
+def programme_renamed(sender, instance, created, **kwargs):
+    # the programme and department names are indexed with every student
+    if created:
+        return
+    lookup = 'pgm' if sender is Programme else 'pgm__dept_id'
+    for model in (Student, Trash):
+        index_people(model, model.objects.filter(**{lookup: instance}).select_related('pgm__dept_id'))
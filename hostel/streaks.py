@@ -0,0 +1,212 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import connection, models, transaction
+from .models import Attendance, AttendanceDate, Student, AbsenceStreak
+from .caching import bump_attendance_version
+from .locking import take_write_lock
+
+# minimum number of consecutive absent days that earns a mess reduction
+MIN_STREAK = 7
+
+STREAK_SQL = """
+    WITH absences AS (
+        SELECT a.name_id AS student_id,
+               julianday(d.date) - ROW_NUMBER() OVER (PARTITION BY a.name_id ORDER BY d.date) AS grp
+        FROM {attendance} a
+        JOIN {attendance_date} d ON d.id = a.date_id
+        JOIN {student} s ON s.id = a.name_id
+        WHERE d.date BETWEEN %s AND %s AND NOT s."E_Grantz"
+    ),
+    runs AS (
+        SELECT student_id, COUNT(*) AS length
+        FROM absences
+        GROUP BY student_id, grp
+    )
+    SELECT student_id, SUM(length)
+    FROM runs
+    WHERE length >= %s
+    GROUP BY student_id
+"""
+
+
+#function to find continuous absences
+def find_continuous_absences(start_date, end_date):
+    # Gaps and islands: consecutive days of one student share the same
+    # (day - row number) value, so every run is one group in a single query
+    if connection.vendor != 'sqlite':
+        return find_continuous_absences_reference(start_date, end_date)
+
+    sql = STREAK_SQL.format(
+        attendance=Attendance._meta.db_table,
+        attendance_date=AttendanceDate._meta.db_table,
+        student=Student._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [start_date, end_date, MIN_STREAK])
+        return {student_id: days for student_id, days in cursor.fetchall()}
+
+
+# Row by row reference implementation, kept to check the SQL version against
+def find_continuous_absences_reference(start_date, end_date):
+    absences = (Attendance.objects.filter(date__date__range=(start_date, end_date))
+                .select_related('name', 'date').order_by('name', 'date__date'))
+
+    #Initialize a dictionary to store the continuous absences for each student
+    continuous_absences = defaultdict(int)
+
+    current_student = None
+    current_streak = 0
+    last_date = None
+
+    for absence in absences:
+
+        stud = absence.name
+        if stud.E_Grantz: # Skip students with eGrantz
+            continue
+
+        student_id = stud.id
+        absence_date = absence.date.date
+
+        # Check if the current absence record belongs to a different student
+        if current_student != student_id:
+            # If the previous student had a streak of 7 or more absences, add it to the dictionary
+            if current_streak >= MIN_STREAK:
+                continuous_absences[current_student] += current_streak
+
+            # Update current student and reset streak for the new student
+            current_student = student_id
+            current_streak = 1
+            last_date = absence_date
+        else:
+            # Check if the current absence is continuous with the previous one
+            if absence_date == last_date + timedelta(days=1):
+                current_streak += 1
+            else:
+                # If the absence is not continuous, check if the streak is 7 or more
+                if current_streak >= MIN_STREAK:
+                    continuous_absences[current_student] += current_streak
+                # Reset the streak for the new absence streak
+                current_streak = 1
+            # Update the last absence date for the current student
+            last_date = absence_date
+
+    # Final check for the last student in the list
+    if current_streak >= MIN_STREAK:
+        continuous_absences[current_student] += current_streak
+
+    return dict(continuous_absences)
+
+
+# Incrementally maintained runs: AbsenceStreak keeps one row per maximal run of
+# consecutive absent days, updated whenever attendance is written or removed
+
+def add_absences(day, student_ids):
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    before = day - timedelta(days=1)
+    after = day + timedelta(days=1)
+    left = {}
+    right = {}
+    neighbours = AbsenceStreak.objects.filter(name_id__in=student_ids).filter(
+        models.Q(last_date=before) | models.Q(start_date=after))
+    for run in neighbours:
+        if run.last_date == before:
+            left[run.name_id] = run
+        else:
+            right[run.name_id] = run
+
+    updated, created, merged = [], [], []
+    for student_id in student_ids:
+        prev_run = left.get(student_id)
+        next_run = right.get(student_id)
+        if prev_run and next_run:
+            prev_run.last_date = next_run.last_date
+            prev_run.length += next_run.length + 1
+            updated.append(prev_run)
+            merged.append(next_run.id)
+        elif prev_run:
+            prev_run.last_date = day
+            prev_run.length += 1
+            updated.append(prev_run)
+        elif next_run:
+            next_run.start_date = day
+            next_run.length += 1
+            updated.append(next_run)
+        else:
+            created.append(AbsenceStreak(name_id=student_id, start_date=day, last_date=day, length=1))
+
+    AbsenceStreak.objects.filter(id__in=merged).delete()
+    AbsenceStreak.objects.bulk_update(updated, ['start_date', 'last_date', 'length'])
+    AbsenceStreak.objects.bulk_create(created)
+    bump_attendance_version()
+
+
+def remove_absences(day, student_ids):
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    runs = AbsenceStreak.objects.filter(name_id__in=student_ids, start_date__lte=day, last_date__gte=day)
+
+    updated, created, removed = [], [], []
+    for run in runs:
+        if run.start_date == run.last_date:
+            removed.append(run.id)
+        elif run.start_date == day:
+            run.start_date = day + timedelta(days=1)
+            run.length -= 1
+            updated.append(run)
+        elif run.last_date == day:
+            run.last_date = day - timedelta(days=1)
+            run.length -= 1
+            updated.append(run)
+        else:
+            # split the run around the removed day
+            tail = AbsenceStreak(name_id=run.name_id, start_date=day + timedelta(days=1), last_date=run.last_date)
+            tail.length = (tail.last_date - tail.start_date).days + 1
+            run.last_date = day - timedelta(days=1)
+            run.length = (run.last_date - run.start_date).days + 1
+            updated.append(run)
+            created.append(tail)
+
+    AbsenceStreak.objects.filter(id__in=removed).delete()
+    AbsenceStreak.objects.bulk_update(updated, ['start_date', 'last_date', 'length'])
+    AbsenceStreak.objects.bulk_create(created)
+    bump_attendance_version()
+
+
+def rebuild_streaks():
+    # Recomputes every run from the raw Attendance rows
+    rows = (Attendance.objects.order_by('name_id', 'date__date')
+            .values_list('name_id', 'date__date').iterator(chunk_size=2000))
+    runs = []
+    current = None
+    for student_id, day in rows:
+        if current and current.name_id == student_id and day == current.last_date + timedelta(days=1):
+            current.last_date = day
+            current.length += 1
+        else:
+            current = AbsenceStreak(name_id=student_id, start_date=day, last_date=day, length=1)
+            runs.append(current)
+
+    with transaction.atomic():
+        take_write_lock()
+        AbsenceStreak.objects.all().delete()
+        AbsenceStreak.objects.bulk_create(runs, batch_size=500)
+    bump_attendance_version()
+    return len(runs)
+
+
+def streak_reductions(start_date, end_date, e_grantz=False):
+    # Same result as find_continuous_absences, read from the maintained runs. Only
+    # students whose current E-Grantz status is e_grantz are included, None includes all
+    runs = AbsenceStreak.objects.filter(start_date__lte=end_date, last_date__gte=start_date)
+    if e_grantz is not None:
+        runs = runs.filter(name__E_Grantz=e_grantz)
+    runs = runs.values_list('name_id', 'start_date', 'last_date')
+    reductions = defaultdict(int)
+    for student_id, run_start, run_end in runs:
+        days = (min(run_end, end_date) - max(run_start, start_date)).days + 1
+        if days >= MIN_STREAK:
+            reductions[student_id] += days
+    return dict(reductions)
@@ -0,0 +1,10 @@
+from django import template
+from ..photos import photo_url as variant_url
+
+register = template.Library()
+
+
+# {% photo_url student 'avatar' %}, sizes are listed in photos.PHOTO_SIZES
+@register.simple_tag
+def photo_url(person, size):
+    return variant_url(person, size) or ''
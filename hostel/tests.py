@@ -1,3 +1,1370 @@
-from django.test import TestCase
+import asyncio
+import os
+import subprocess
+import sys
+import json
+import random
+import zipfile
+from io import BytesIO
+from xml.etree import ElementTree
+from PIL import Image
+from io import StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import connection, transaction
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+import tempfile
+import threading
+from unittest.mock import patch
+import time
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from .models import *
+from .billing import apply_recompute, generate_bill, preview_bill, bill_period, recompute_bill
+from .filters import attendanceFilter
+from .pagination import KeysetPaginator
+from .attendance import record_attendance, delete_attendance_date, update_attendance
+from . import bitmaps, views
+from .imports import import_attendance, import_students
+from .search import ARCHIVED, STUDENT, count_people, search, search_people
+from .photos import PHOTO_SIZES, STORED_WIDTH, VARIANT_DIR, photo_url
+from django.urls import reverse
+from .forms import AttendanceForm, StudentForm
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from .streaks import *
+from .jobs import claim_next, enqueue, recover_stale, run_job, STALE_AFTER
+from django.utils import timezone
+from django.utils.timezone import localtime
+from django.core.cache import cache
+from django.conf import settings
+from .caching import attendance_version, bump
+from django.core.files.storage import default_storage, storages
 
 # Create your tests here.
+
+
+def make_students(count, start=0, e_grantz=False):
+    dept, _ = Department.objects.get_or_create(dept_name='Physics')
+    pgm, _ = Programme.objects.get_or_create(pgm_name='MSc Physics', dept_id=dept)
+    return Student.objects.bulk_create([
+        Student(admn_no=1000 + i, name=f'Student {i}', pgm=pgm, dob=date(2004, 1, 1),
+                email=f's{i}@example.com', contact='9999999999', E_Grantz=e_grantz)
+        for i in range(start, start + count)
+    ])
+
+
+def mark_absent(student, first_day, days):
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        att_date, _ = AttendanceDate.objects.get_or_create(date=day, defaults={'month': day.strftime('%B'), 'year': day.year})
+        Attendance.objects.create(date=att_date, name=student)
+        add_absences(day, [student.id])
+        bitmaps.set_absent(day, [student.id])
+
+
+def login_warden(client):
+    user = User.objects.create_user('warden', password='secret')
+    user.groups.add(Group.objects.get_or_create(name='warden')[0])
+    client.force_login(user)
+    return user
+
+
+class BillingTests(TestCase):
+    start = date(2024, 5, 1)
+    end = date(2024, 5, 31)
+
+    def generate(self):
+        return generate_bill(self.start, self.end, Decimal('100000'), Decimal('500'), Decimal('10000'), Decimal('3000'))
+
+    def test_bill_amounts(self):
+        students = make_students(3)
+        mark_absent(students[0], date(2024, 5, 10), 7)
+        bill = self.generate()
+
+        self.assertEqual(bill.no_of_students, 3)
+        self.assertEqual(bill.total, Decimal('114500'))
+        streak = ContinuousAbsence.objects.get()
+        self.assertEqual((streak.name_id, streak.streak), (students[0].id, 7))
+
+        totals = dict(StudentBill.objects.values_list('name_id', 'total'))
+        per_day = Decimal('100000') / (31 * 3 - 7)
+        others = Decimal('14500') / 3
+        self.assertEqual(totals[students[0].id], round(per_day * 24 + others, 2))
+        self.assertEqual(totals[students[1].id], round(per_day * 31 + others + 300, 2))
+
+    def test_duplicate_month_is_rejected(self):
+        make_students(2)
+        self.generate()
+        with self.assertRaises(ValueError):
+            self.generate()
+        self.assertEqual(StudentBill.objects.count(), 2)
+
+    def test_query_count_is_constant(self):
+        # benchmark: the bill run must not issue more queries as the hostel grows
+        # (sizes stay below one SQLite insert batch of 999 parameters)
+        counts = []
+        for size in (5, 120):
+            MessBill.objects.all().delete()
+            Student.objects.all().delete()
+            students = make_students(size)
+            mark_absent(students[0], date(2024, 5, 3), 8)
+            with CaptureQueriesContext(connection) as ctx:
+                self.generate()
+            counts.append(len(ctx.captured_queries))
+            self.assertEqual(StudentBill.objects.count(), size)
+        self.assertEqual(counts[0], counts[1])
+
+
+    def test_write_transactions_take_the_lock_first(self):
+        make_students(3)
+
+        def after_begin(write):
+            with CaptureQueriesContext(connection) as ctx:
+                write()
+            # the outermost atomic is a savepoint inside the test's transaction
+            sql = [query['sql'] for query in ctx.captured_queries]
+            start = next(i for i, statement in enumerate(sql) if statement.startswith(('BEGIN', 'SAVEPOINT')))
+            return sql[start + 1]
+
+        lock = 'UPDATE "hostel_attendancedate" SET "year" = 0'
+        self.assertTrue(after_begin(self.generate).startswith(lock))
+        self.assertTrue(after_begin(lambda: recompute_bill(MessBill.objects.get().id)).startswith(lock))
+        self.assertTrue(after_begin(lambda: record_attendance(date(2024, 6, 1), [])).startswith(lock))
+
+
+class StreakTests(TestCase):
+    def test_sql_matches_reference(self):
+        rng = random.Random(7)
+        students = make_students(30) + make_students(5, start=30, e_grantz=True)
+        days = [date(2024, 3, 1) + timedelta(days=i) for i in range(60)]
+        att_dates = AttendanceDate.objects.bulk_create([
+            AttendanceDate(date=day, month=day.strftime('%B'), year=day.year, period=period_of(day)) for day in days
+        ])
+        rows = []
+        for student in students:
+            absent = False
+            for att_date in att_dates:
+                # sticky coin so that long runs show up next to single days
+                absent = rng.random() < (0.85 if absent else 0.15)
+                if absent:
+                    rows.append(Attendance(date=att_date, name=student))
+        Attendance.objects.bulk_create(rows)
+        bitmaps.rebuild_bitmaps()
+
+        for start, end in [(days[0], days[-1]), (days[10], days[40]), (days[5], days[6])]:
+            self.assertEqual(find_continuous_absences(start, end), find_continuous_absences_reference(start, end))
+            self.assertEqual(bitmaps.find_continuous_absences(start, end), find_continuous_absences_reference(start, end))
+        self.assertTrue(find_continuous_absences(days[0], days[-1]))
+
+    def test_run_is_clipped_to_period(self):
+        student = make_students(1)[0]
+        mark_absent(student, date(2024, 4, 26), 12)
+        self.assertEqual(find_continuous_absences(date(2024, 5, 1), date(2024, 5, 31)), {student.id: 7})
+        self.assertEqual(find_continuous_absences(date(2024, 5, 2), date(2024, 5, 31)), {})
+
+    def test_single_query(self):
+        student = make_students(1)[0]
+        mark_absent(student, date(2024, 5, 1), 9)
+        with self.assertNumQueries(1):
+            self.assertEqual(find_continuous_absences(date(2024, 5, 1), date(2024, 5, 31)), {student.id: 9})
+
+
+class AbsenceStreakTests(TestCase):
+    def runs(self):
+        return sorted(AbsenceStreak.objects.values_list('name_id', 'start_date', 'last_date', 'length'))
+
+    def test_incremental_matches_rebuild(self):
+        rng = random.Random(3)
+        students = make_students(8)
+        days = [date(2024, 6, 1) + timedelta(days=i) for i in range(40)]
+        att_dates = {day: AttendanceDate.objects.create(date=day, month=day.strftime('%B'), year=day.year) for day in days}
+        present = set()
+        for _ in range(600):
+            student = rng.choice(students)
+            day = rng.choice(days)
+            if (student.id, day) in present:
+                Attendance.objects.filter(date=att_dates[day], name=student).delete()
+                remove_absences(day, [student.id])
+                present.discard((student.id, day))
+            else:
+                Attendance.objects.create(date=att_dates[day], name=student)
+                add_absences(day, [student.id])
+                present.add((student.id, day))
+
+        incremental = self.runs()
+        for student_id, start, last, length in incremental:
+            self.assertEqual(length, (last - start).days + 1)
+        self.assertEqual(streak_reductions(days[0], days[-1]), find_continuous_absences(days[0], days[-1]))
+        self.assertEqual(streak_reductions(days[3], days[30]), find_continuous_absences(days[3], days[30]))
+
+        call_command('rebuild_streaks', stdout=StringIO())
+        self.assertEqual(self.runs(), incremental)
+
+    def test_split_and_merge(self):
+        student = make_students(1)[0]
+        mark_absent(student, date(2024, 7, 1), 9)
+        remove_absences(date(2024, 7, 5), [student.id])
+        self.assertEqual(self.runs(), [
+            (student.id, date(2024, 7, 1), date(2024, 7, 4), 4),
+            (student.id, date(2024, 7, 6), date(2024, 7, 9), 4),
+        ])
+        add_absences(date(2024, 7, 5), [student.id])
+        self.assertEqual(self.runs(), [(student.id, date(2024, 7, 1), date(2024, 7, 9), 9)])
+
+    def test_views_keep_table_in_sync(self):
+        login_warden(self.client)
+        students = make_students(3)
+        for offset in range(3):
+            day = date(2024, 8, 1) + timedelta(days=offset)
+            self.client.post('/attendance/', {'date': day, 'absentees': f'{students[0].id},{students[1].id}'})
+        self.assertEqual(self.runs(), [
+            (students[0].id, date(2024, 8, 1), date(2024, 8, 3), 3),
+            (students[1].id, date(2024, 8, 1), date(2024, 8, 3), 3),
+        ])
+        middle = AttendanceDate.objects.get(date=date(2024, 8, 2))
+        self.client.get(f'/delete_att/{middle.id}/')
+        self.assertEqual(len(self.runs()), 4)
+
+    def test_admin_cannot_edit_attendance(self):
+        # an admin edit would bypass the streak upkeep
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        student = make_students(1)[0]
+        mark_absent(student, date(2024, 8, 1), 2)
+        absence = Attendance.objects.first()
+        for url in (reverse('admin:hostel_attendance_add'),
+                    reverse('admin:hostel_attendance_delete', args=[absence.id]),
+                    reverse('admin:hostel_attendancedate_delete', args=[absence.date_id])):
+            self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.post(reverse('admin:hostel_attendance_change', args=[absence.id]), {'date': absence.date_id, 'name': student.id})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:hostel_attendance_changelist')).status_code, 200)
+        self.assertEqual(len(self.runs()), 1)
+
+
+class BillJobTests(TestCase):
+    form = {
+        'start_date': '2024-05-01', 'end_date': '2024-05-31', 'total_mess_amount': '100000',
+        'room_rent': '500', 'staff_salary': '10000', 'electricity_bill': '3000',
+    }
+
+    def setUp(self):
+        login_warden(self.client)
+        self.students = make_students(4)
+        mark_absent(self.students[0], date(2024, 5, 1), 1)
+        mark_absent(self.students[0], date(2024, 5, 31), 1)
+
+    def test_bill_is_generated_by_worker(self):
+        response = self.client.post('/messbill', self.form)
+        job = Job.objects.get()
+        self.assertRedirects(response, f'/messbill?job={job.id}')
+        self.assertFalse(MessBill.objects.exists())
+        self.assertEqual(self.client.get(f'/jobs/{job.id}/').json()['status'], 'queued')
+
+        call_command('run_worker', '--once', stdout=StringIO())
+        status = self.client.get(f'/jobs/{job.id}/').json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+        self.assertEqual(status['url'], '/monthlybills/May/2024/')
+        self.assertEqual(StudentBill.objects.count(), 4)
+
+    def test_failed_job_rolls_back(self):
+        Student.objects.all().delete()
+        enqueue('generate_bill', **self.form)
+        job = run_job(claim_next())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('There are no students to bill', job.error)
+        self.assertFalse(MessBill.objects.exists())
+
+    def test_stale_job_is_resumed(self):
+        job = enqueue('generate_bill', **self.form)
+        claim_next()
+        Job.objects.filter(id=job.id).update(heartbeat=timezone.now() - STALE_AFTER * 2)
+        self.assertEqual(recover_stale(), (1, 0))
+        job = run_job(claim_next())
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.assertEqual(job.result['bill_id'], MessBill.objects.get().id)
+
+
+class BillPreviewTests(TestCase):
+    start = date(2024, 5, 1)
+    end = date(2024, 5, 31)
+
+    def setUp(self):
+        cache.clear()
+        self.students = make_students(3) + make_students(2, start=3, e_grantz=True)
+        mark_absent(self.students[0], date(2024, 5, 2), 8)
+
+    def test_preview_matches_generated_bill(self):
+        amounts = (Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+        preview = preview_bill(self.start, self.end, *amounts)
+        self.assertFalse(MessBill.objects.exists())
+
+        generate_bill(self.start, self.end, *amounts)
+        stored = sorted(StudentBill.objects.values_list('name__name', 'total'))
+        previewed = sorted((row['name'], row['total']) for row in preview['true_bills'] + preview['false_bills'])
+        self.assertEqual(previewed, stored)
+        self.assertEqual(len(preview['true_bills']), 2)
+        self.assertEqual(preview['summary']['reduction_days'], 8)
+
+    def test_repeat_preview_is_memoized(self):
+        preview_bill(self.start, self.end, Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+        with self.assertNumQueries(0):
+            preview = preview_bill(self.start, self.end, Decimal('95000'), Decimal('500'), Decimal('10000'), Decimal('4000'))
+        self.assertEqual(preview['summary']['total'], Decimal('95000') + 2500 + 10000 + 4000)
+
+        # new attendance invalidates the cached streak map
+        mark_absent(self.students[1], date(2024, 5, 20), 7)
+        preview = preview_bill(self.start, self.end, Decimal('95000'), Decimal('500'), Decimal('10000'), Decimal('4000'))
+        self.assertEqual(preview['summary']['reduction_days'], 15)
+
+    def test_preview_view_writes_nothing(self):
+        login_warden(self.client)
+        mark_absent(self.students[2], self.start, 1)
+        mark_absent(self.students[2], self.end, 1)
+        response = self.client.post('/messbill', {
+            'start_date': '2024-05-01', 'end_date': '2024-05-31', 'total_mess_amount': '90000',
+            'room_rent': '500', 'staff_salary': '10000', 'electricity_bill': '2500', 'preview': '',
+        })
+        self.assertContains(response, 'Preview for May, 2024')
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(MessBill.objects.exists())
+
+
+class RecomputeBillsTests(TestCase):
+    def setUp(self):
+        self.students = make_students(3)
+        self.bill = generate_bill(date(2024, 5, 1), date(2024, 5, 31), Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+        self.stored = dict(StudentBill.objects.values_list('name_id', 'total'))
+        # attendance corrected after the bill was generated
+        mark_absent(self.students[0], date(2024, 5, 10), 10)
+
+    def test_dry_run_only_reports(self):
+        out = StringIO()
+        call_command('recompute_bills', '2024-05', '--workers', '1', '--dry-run', stdout=out)
+        self.assertIn('May-2024', out.getvalue())
+        self.assertIn('Checked 1 bills', out.getvalue())
+        self.assertEqual(dict(StudentBill.objects.values_list('name_id', 'total')), self.stored)
+
+    def test_recompute_rewrites_month(self):
+        call_command('recompute_bills', '2024-01', '2024-12', '--workers', '1', stdout=StringIO())
+        self.assertEqual(ContinuousAbsence.objects.get().streak, 10)
+        recomputed = dict(StudentBill.objects.values_list('name_id', 'total'))
+        self.assertLess(recomputed[self.students[0].id], self.stored[self.students[0].id])
+        self.assertEqual(MessBill.objects.get().total, self.bill.total)
+
+    def test_students_admitted_later_are_not_billed(self):
+        late = make_students(1, start=10, e_grantz=True)[0]
+        Student.objects.filter(id=self.students[1].id).update(E_Grantz=True)
+        report = recompute_bill(self.bill.id)
+        self.assertFalse(StudentBill.objects.filter(name=late).exists())
+        self.assertEqual(MessBill.objects.get().no_of_students, 3)
+        self.assertEqual(report['new_total'], self.bill.total)
+        # the E-Grantz status is the one stored with the bill
+        self.assertEqual(BillSummary.objects.get().e_grantz_count, 0)
+
+    def test_e_grantz_stored_with_the_bill_is_used(self):
+        Student.objects.filter(id=self.students[0].id).update(E_Grantz=True)
+        recompute_bill(self.bill.id)
+        # still billed without E-Grantz, so the streak still reduces the bill
+        self.assertEqual(ContinuousAbsence.objects.get().name_id, self.students[0].id)
+        self.assertEqual(BillSummary.objects.get().streak_count, 1)
+
+    def test_period_of_old_bills(self):
+        MessBill.objects.filter(id=self.bill.id).update(start_date=None, end_date=None)
+        self.bill.refresh_from_db()
+        self.assertEqual(bill_period(self.bill), (date(2024, 5, 1), date(2024, 5, 31)))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        login_warden(self.client)
+        make_students(3)
+        make_students(2, start=3, e_grantz=True)
+        generate_bill(date(2024, 5, 1), date(2024, 5, 31), Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+
+    def test_monthly_csv(self):
+        response = self.client.get('/monthlybills/May/2024/export/csv/')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Admission No,Name,E-Grantz,Month,Year,Amount')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].split(',')[2] == 'True' and lines[-1].split(',')[2] == 'False')
+
+    def test_monthly_xlsx(self):
+        response = self.client.get('/monthlybills/May/2024/export/xlsx/')
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        ns = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        sheets = [ElementTree.fromstring(archive.read(f'xl/worksheets/sheet{i}.xml')) for i in (1, 2)]
+        self.assertEqual([len(sheet.findall('.//x:row', ns)) for sheet in sheets], [3, 4])
+
+    def test_status_billed_with_is_exported(self):
+        # a student who got E-Grantz after the bill stays on the sheet they were billed on
+        Student.objects.filter(admn_no=1000).update(E_Grantz=True)
+        response = self.client.get('/monthlybills/May/2024/export/csv/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ['True', 'True', 'False', 'False', 'False'])
+
+    def test_history_export_and_unknown_format(self):
+        response = self.client.get('/totalbill/export/csv/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1].split(',')[:3], ['May', '2024', '5'])
+        self.assertEqual(self.client.get('/totalbill/export/pdf/').status_code, 404)
+
+
+class BillSummaryTests(TestCase):
+    def setUp(self):
+        self.students = make_students(3) + make_students(2, start=3, e_grantz=True)
+        mark_absent(self.students[0], date(2024, 5, 4), 9)
+        self.bill = generate_bill(date(2024, 5, 1), date(2024, 5, 31), Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+
+    def test_summary_matches_student_bills(self):
+        summary = BillSummary.objects.get(bill_id=self.bill)
+        totals = StudentBill.objects.aggregate(
+            e_grantz=models.Sum('total', filter=models.Q(name__E_Grantz=True)),
+            others=models.Sum('total', filter=models.Q(name__E_Grantz=False)))
+        self.assertEqual(summary.e_grantz_total, totals['e_grantz'])
+        self.assertEqual(summary.non_e_grantz_total, totals['others'])
+        self.assertEqual(summary.students_total, totals['e_grantz'] + totals['others'])
+        self.assertEqual((summary.e_grantz_count, summary.non_e_grantz_count), (2, 3))
+        self.assertEqual((summary.streak_count, summary.reduction_days), (1, 9))
+
+    def test_summary_removed_with_bill(self):
+        login_warden(self.client)
+        self.client.get(f'/deletebill/{self.bill.id}/')
+        self.assertFalse(BillSummary.objects.exists())
+
+    def test_dashboard_reads_summary(self):
+        login_warden(self.client)
+        response = self.client.get('/bill_dashboard')
+        self.assertContains(response, 'Streak reductions: 1 (9 days)')
+        response = self.client.get('/totalbill')
+        self.assertContains(response, str(BillSummary.objects.get().students_total))
+
+
+class PeriodKeyTests(TestCase):
+    def setUp(self):
+        for day in [date(2023, 12, 30), date(2024, 1, 2), date(2024, 5, 6), date(2025, 5, 7)]:
+            AttendanceDate.objects.create(date=day, month=day.strftime('%B'), year=day.year)
+
+    def dates(self, params):
+        return sorted(attendanceFilter(params, queryset=AttendanceDate.objects.all()).qs.values_list('date', flat=True))
+
+    def test_period_is_filled_on_save(self):
+        self.assertEqual(AttendanceDate.objects.get(date=date(2024, 5, 6)).period, 202405)
+        self.assertEqual(period_key(2024, 'May'), period_of(date(2024, 5, 31)))
+
+    def test_filters_use_period(self):
+        self.assertEqual(self.dates({'year': '2024'}), [date(2024, 1, 2), date(2024, 5, 6)])
+        self.assertEqual(self.dates({'month': 'May'}), [date(2024, 5, 6), date(2025, 5, 7)])
+        self.assertEqual(self.dates({'month': 'May', 'year': '2025'}), [date(2025, 5, 7)])
+        self.assertEqual(len(self.dates({})), 4)
+
+    def test_monthly_bill_view(self):
+        login_warden(self.client)
+        make_students(2)
+        generate_bill(date(2024, 5, 1), date(2024, 5, 31), Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+        self.assertEqual(set(StudentBill.objects.values_list('period', flat=True)), {202405})
+        response = self.client.get('/monthlybills/May/2024/')
+        self.assertEqual(len(response.context['false_bills']), 2)
+
+
+class MonthlyBillViewTests(TestCase):
+    def setUp(self):
+        login_warden(self.client)
+
+    def bill_for(self, count):
+        MessBill.objects.all().delete()
+        Student.objects.all().delete()
+        make_students(count - count // 3)
+        make_students(count // 3, start=count, e_grantz=True)
+        generate_bill(date(2024, 5, 1), date(2024, 5, 31), Decimal('90000'), Decimal('500'), Decimal('10000'), Decimal('2500'))
+
+    def test_query_count_is_fixed(self):
+        counts = []
+        for size in (6, 240):
+            self.bill_for(size)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/monthlybills/May/2024/')
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_pages_cover_the_month_once(self):
+        self.bill_for(240)
+        seen = []
+        url = '/monthlybills/May/2024/'
+        while url:
+            response = self.client.get(url)
+            page = response.context['page_obj']
+            seen += [(True, bill.name.name) for bill in response.context['true_bills']]
+            seen += [(False, bill.name.name) for bill in response.context['false_bills']]
+            url = f'/monthlybills/May/2024/?after={page.next_cursor}' if page.has_next else None
+        expected = list(StudentBill.objects.order_by('-name__E_Grantz', 'name__name', 'id')
+                        .values_list('name__E_Grantz', 'name__name'))
+        self.assertEqual(seen, expected)
+        self.assertEqual(response.context['subtotals']['e_grantz_count'], 80)
+        self.assertEqual(response.context['subtotals']['non_e_grantz_total'],
+                         StudentBill.objects.filter(name__E_Grantz=False).aggregate(t=models.Sum('total'))['t'])
+
+    def test_status_billed_with_is_shown(self):
+        self.bill_for(6)
+        Student.objects.filter(E_Grantz=True).update(E_Grantz=False)
+        response = self.client.get('/monthlybills/May/2024/')
+        summary = BillSummary.objects.get()
+        self.assertEqual(len(response.context['true_bills']), 2)
+        self.assertEqual(response.context['subtotals']['e_grantz_count'], summary.e_grantz_count)
+        self.assertEqual(response.context['subtotals']['e_grantz_total'], summary.e_grantz_total)
+
+    def test_previous_page(self):
+        make_students(25)
+        paginator = KeysetPaginator(Student.objects.all(), ['-name', 'id'], 10)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(before_cursor=second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+        self.assertFalse(paginator.get_page('not a cursor').has_previous)
+
+
+class AttendanceWriteTests(TestCase):
+    def test_bulk_write_for_5000_students(self):
+        # benchmark: the old path issued several queries per absentee
+        students = make_students(5000)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            record_attendance(date(2024, 6, 1), [student.id for student in students])
+        elapsed = time.perf_counter() - started
+        # only grows with SQLite's 999 parameter insert batches (attendance, streaks, bitmaps)
+        self.assertLess(len(ctx.captured_queries), 80)
+        self.assertLess(elapsed, 10)
+        self.assertEqual(Attendance.objects.count(), 5000)
+        self.assertEqual(AbsenceStreak.objects.count(), 5000)
+
+    def test_view_records_by_student_id(self):
+        login_warden(self.client)
+        students = make_students(2)
+        Student.objects.filter(id=students[1].id).update(name=students[0].name)
+        self.client.post('/attendance/', {'date': '2024-06-02', 'absentees': str(students[1].id)})
+        self.assertEqual(list(Attendance.objects.values_list('name_id', flat=True)), [students[1].id])
+
+    def test_second_submission_is_rejected(self):
+        students = make_students(3)
+        record_attendance(date(2024, 6, 3), [students[0].id])
+        with self.assertRaises(ValueError):
+            record_attendance(date(2024, 6, 3), [students[1].id, students[2].id])
+        self.assertEqual(list(Attendance.objects.values_list('name_id', flat=True)), [students[0].id])
+
+    def test_removing_absentees_bumps_the_version_once(self):
+        students = make_students(300)
+        attendance_date = record_attendance(date(2024, 6, 4), [student.id for student in students])
+        with patch('hostel.caching.bump', wraps=bump) as bumps:
+            with CaptureQueriesContext(connection) as ctx:
+                update_attendance(attendance_date, [])
+        # one DELETE for the rows, no per-row signals
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "hostel_attendance"')]), 1)
+        self.assertLess(bumps.call_count, 5)
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_day_without_absentees_refreshes_the_dashboard(self):
+        make_students(2)
+        version = attendance_version()
+        record_attendance(date(2024, 6, 5), [])
+        self.assertNotEqual(attendance_version(), version)
+
+
+class ParallelRecomputeTests(TransactionTestCase):
+    def test_months_are_computed_in_parallel_and_written_in_turn(self):
+        # the workers read through their own connections, so the data has to be committed
+        students = make_students(40)
+        for month in range(1, 7):
+            generate_bill(date(2024, month, 1), date(2024, month, 28), Decimal('90000'), Decimal('500'),
+                          Decimal('10000'), Decimal('2500'))
+        mark_absent(students[0], date(2024, 3, 5), 10)
+        writers = []
+
+        def apply(plan):
+            writers.append(os.getpid())
+            apply_recompute(plan)
+
+        out = StringIO()
+        with patch('hostel.management.commands.recompute_bills.apply_recompute', apply):
+            call_command('recompute_bills', '2024-01', '2024-06', '--workers', '3', stdout=out)
+        self.assertIn('Recomputed 6 bills', out.getvalue())
+        # only the parent writes, SQLite would lock out workers writing at the same time
+        self.assertEqual(writers, [os.getpid()] * 6)
+        self.assertEqual(list(ContinuousAbsence.objects.values_list('name_id', 'streak')), [(students[0].id, 10)])
+        self.assertEqual(StudentBill.objects.count(), 6 * 40)
+        self.assertEqual(BillSummary.objects.count(), 6)
+
+
+class ConcurrentAttendanceTests(TransactionTestCase):
+    def test_two_wardens_submit_same_date(self):
+        students = make_students(50)
+        ids = [student.id for student in students]
+        barrier = threading.Barrier(2)
+        results = []
+
+        def warden(absentees):
+            barrier.wait()
+            try:
+                record_attendance(date(2024, 6, 4), absentees)
+                results.append('saved')
+            except ValueError:
+                results.append('rejected')
+            except Exception as e:
+                results.append(type(e).__name__)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=warden, args=(ids[:30],)), threading.Thread(target=warden, args=(ids[20:],))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), ['rejected', 'saved'])
+        self.assertEqual(AttendanceDate.objects.count(), 1)
+        self.assertEqual(Attendance.objects.count(), 30)
+        self.assertEqual(AbsenceStreak.objects.count(), 30)
+
+
+class AttendanceBitmapTests(TestCase):
+    def test_bitmaps_match_attendance_rows(self):
+        rng = random.Random(11)
+        students = make_students(20) + make_students(3, start=20, e_grantz=True)
+        days = [date(2024, 1, 20) + timedelta(days=i) for i in range(75)]
+        for day in days:
+            chosen = [s.id for s in students if rng.random() < 0.4]
+            record_attendance(day, chosen)
+        # delete a few dates again so that bits are cleared too
+        for day in days[::9]:
+            delete_attendance_date(AttendanceDate.objects.get(date=day))
+
+        for start, end in [(days[0], days[-1]), (date(2024, 2, 1), date(2024, 2, 29)), (days[5], days[50])]:
+            self.assertEqual(bitmaps.find_continuous_absences(start, end), find_continuous_absences(start, end))
+
+        student = students[0]
+        stored = list(Attendance.objects.filter(name=student).order_by('date__date').values_list('date__date', flat=True))
+        self.assertEqual(bitmaps.all_absent_dates(student.id), stored)
+        self.assertEqual(bitmaps.absent_dates(student.id, date(2024, 2, 1), date(2024, 2, 29)),
+                         [day for day in stored if day.month == 2])
+        self.assertEqual(bitmaps.absent_count(student.id, days[0], days[-1]), len(stored))
+
+        masks = sorted(AttendanceBitmap.objects.values_list('name_id', 'period', 'mask'))
+        bitmaps.rebuild_bitmaps()
+        self.assertEqual(sorted(AttendanceBitmap.objects.values_list('name_id', 'period', 'mask')), masks)
+
+    def test_bit_helpers(self):
+        self.assertEqual(bitmaps.runs(0b1110011011111), [5, 2, 3])
+        self.assertEqual(bitmaps.longest_run(0b1110011011111), 5)
+        student = make_students(1)[0]
+        mark_absent(student, date(2024, 1, 28), 9)
+        self.assertEqual(bitmaps.student_longest_run(student.id, date(2024, 1, 1), date(2024, 3, 31)), 9)
+        self.assertEqual(bitmaps.find_continuous_absences(date(2024, 2, 1), date(2024, 2, 29)), {})
+        self.assertEqual(bitmaps.find_continuous_absences(date(2024, 1, 1), date(2024, 2, 29)), {student.id: 9})
+
+    def test_absent_records_view(self):
+        login_warden(self.client)
+        student = make_students(1)[0]
+        mark_absent(student, date(2024, 3, 30), 3)
+        response = self.client.get(f'/days/{student.id}/')
+        self.assertEqual(list(response.context['page_obj']), [date(2024, 3, 30), date(2024, 3, 31), date(2024, 4, 1)])
+
+    def test_admin_cannot_edit_bitmaps(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        mark_absent(make_students(1)[0], date(2024, 3, 30), 1)
+        bitmap = AttendanceBitmap.objects.get()
+        response = self.client.post(reverse('admin:hostel_attendancebitmap_change', args=[bitmap.id]), {'mask': 0})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:hostel_attendancebitmap_delete', args=[bitmap.id])).status_code, 403)
+        self.assertEqual(AttendanceBitmap.objects.get().mask, bitmap.mask)
+
+
+class EditAttendanceTests(TestCase):
+    def setUp(self):
+        self.students = make_students(6)
+        self.ids = [student.id for student in self.students]
+        for offset in range(3):
+            record_attendance(date(2024, 9, 1) + timedelta(days=offset), self.ids[:4])
+        self.middle = AttendanceDate.objects.get(date=date(2024, 9, 2))
+
+    def test_only_the_difference_is_written(self):
+        kept = dict(Attendance.objects.filter(date=self.middle, name_id__in=self.ids[:2]).values_list('name_id', 'id'))
+        added, removed = update_attendance(self.middle, self.ids[:2] + self.ids[4:])
+        self.assertEqual((added, removed), (set(self.ids[4:]), set(self.ids[2:4])))
+        self.assertEqual(dict(Attendance.objects.filter(date=self.middle, name_id__in=self.ids[:2]).values_list('name_id', 'id')), kept)
+        self.assertEqual(set(Attendance.objects.filter(date=self.middle).values_list('name_id', flat=True)),
+                         set(self.ids[:2] + self.ids[4:]))
+
+        runs = sorted(AbsenceStreak.objects.values_list('name_id', 'start_date', 'last_date', 'length'))
+        masks = sorted(AttendanceBitmap.objects.values_list('name_id', 'period', 'mask'))
+        rebuild_streaks()
+        bitmaps.rebuild_bitmaps()
+        self.assertEqual(sorted(AbsenceStreak.objects.values_list('name_id', 'start_date', 'last_date', 'length')), runs)
+        self.assertEqual(sorted(AttendanceBitmap.objects.values_list('name_id', 'period', 'mask')), masks)
+
+    def test_edit_view(self):
+        login_warden(self.client)
+        response = self.client.get(f'/edit_att/{self.middle.id}/')
+        self.assertEqual(set(response.context['form'].initial['absentees']), set(self.ids[:4]))
+        response = self.client.post(f'/edit_att/{self.middle.id}/', {'date': '2030-01-01', 'absentees': str(self.ids[5])})
+        self.assertRedirects(response, f'/attendance/{self.middle.id}/')
+        self.assertEqual(list(Attendance.objects.filter(date=self.middle).values_list('name_id', flat=True)), [self.ids[5]])
+        self.assertTrue(AttendanceDate.objects.filter(date=date(2024, 9, 2)).exists())
+
+
+class AttendanceImportTests(TestCase):
+    def setUp(self):
+        self.students = make_students(3)
+        mark_absent(self.students[0], date(2024, 3, 1), 1)
+
+    def test_csv_import_reports_rejected_lines(self):
+        lines = StringIO(
+            "date,admn_no\n"
+            "2024-03-01,1000\n"     # already recorded
+            "2024-03-01,1001\n"
+            "2024-03-02,1000\n"
+            "2024-03-02,1000\n"     # duplicate
+            "2024-03-03,9999\n"     # unknown student
+            "2024-02-30,1001\n"     # invalid date
+            "2024-03-03,1002\n"
+        )
+        report = import_attendance(lines, 'csv', chunk_size=2)
+        self.assertEqual((report['absences'], report['dates']), (3, 2))
+        self.assertEqual([line for line, reason in report['rejected']], [2, 5, 6, 7])
+        self.assertEqual(Attendance.objects.count(), 4)
+        self.assertEqual(AttendanceDate.objects.get(date=date(2024, 3, 2)).period, 202403)
+        self.assertEqual(streak_reductions(date(2024, 3, 1), date(2024, 3, 31)), {})
+        self.assertEqual(bitmaps.absent_dates(self.students[0].id, date(2024, 3, 1), date(2024, 3, 31)),
+                         [date(2024, 3, 1), date(2024, 3, 2)])
+
+    def test_jsonl_import_in_chunks(self):
+        lines = ['{"date": "2024-04-%02d", "admn_no": %d}\n' % (day, 1000 + student)
+                 for day in range(1, 11) for student in range(3)]
+        lines.insert(5, 'not json\n')
+        with CaptureQueriesContext(connection) as queries:
+            report = import_attendance(lines, 'jsonl', chunk_size=5)
+        self.assertEqual(report['rejected'], [(6, "Could not read the line")])
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "hostel_attendance"')]
+        self.assertEqual(len(inserts), 6)
+        self.assertEqual(Attendance.objects.filter(date__period=202404).count(), 30)
+        self.assertEqual(streak_reductions(date(2024, 4, 1), date(2024, 4, 30)),
+                         {student.id: 10 for student in self.students})
+
+    def test_upload_view(self):
+        login_warden(self.client)
+        upload = SimpleUploadedFile('register.csv', b"date,admn_no\n2024-05-01,1001\n2024-05-01,42\n")
+        response = self.client.post('/attendance/import/', {'file': upload})
+        self.assertEqual(response.context['report']['absences'], 1)
+        self.assertContains(response, "Line 3: Unknown admission number")
+
+    def test_command(self):
+        out = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as handle:
+            handle.write("date,admn_no\n2024-06-01,1002\n")
+            handle.flush()
+            call_command('import_attendance', handle.name, stdout=out)
+        self.assertIn("Imported 1 absences", out.getvalue())
+
+
+class AttendanceRosterTests(TestCase):
+    def setUp(self):
+        login_warden(self.client)
+        self.students = make_students(4)
+        room = Room.objects.create(room_number=101, floor='Ground')
+        Allotment.objects.create(room_number=room, name=self.students[0])
+
+    def test_roster_is_compact_and_etag_cached(self):
+        response = self.client.get('/attendance/roster/')
+        self.assertEqual(response.json()['students'][0], [self.students[0].id, 'Student 0', 101])
+        self.assertEqual(response.json()['students'][1][2], None)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/attendance/roster/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Allotment.objects.all().delete()
+        response = self.client.get('/attendance/roster/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['students'][0][2], None)
+
+    def test_form_render_does_not_depend_on_roster_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/attendance/')
+        make_students(200, start=10)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/attendance/')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertNotContains(response, 'Student 150')
+
+    def test_packed_absentees(self):
+        ids = [student.id for student in self.students]
+        response = self.client.post('/attendance/', {'date': '2024-07-01', 'absentees': f'{ids[2]},{ids[0]},,{ids[2]}'})
+        self.assertContains(response, 'recorded successfully')
+        self.assertEqual(sorted(Attendance.objects.values_list('name_id', flat=True)), [ids[0], ids[2]])
+
+        form = AttendanceForm({'date': '2024-07-02', 'absentees': f'{ids[1]},99999'})
+        self.assertFalse(form.is_valid())
+        form = AttendanceForm({'date': '2024-07-02', 'absentees': 'a,b'})
+        self.assertFalse(form.is_valid())
+
+
+class AttendanceCalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.students = make_students(2)
+        mark_absent(self.students[0], date(2024, 1, 30), 9)
+        mark_absent(self.students[1], date(2024, 3, 5), 1)
+        mark_absent(self.students[0], date(2024, 3, 10), 2)
+
+    def test_calendar(self):
+        with self.assertNumQueries(1):
+            calendar = bitmaps.student_calendar(self.students[0].id, 2024)
+        self.assertEqual([month['period'] for month in calendar['months']], [202401, 202402, 202403])
+        self.assertEqual(calendar['months'][0]['absent'], [30, 31])
+        self.assertEqual(calendar['months'][2]['recorded_days'], 3)
+        self.assertEqual(calendar['months'][2]['attendance_percentage'], 33.33)
+        self.assertEqual((calendar['absent_days'], calendar['recorded_days']), (11, 12))
+        self.assertEqual(calendar['streaks'], [
+            {'start': date(2024, 1, 30), 'end': date(2024, 2, 7), 'length': 9, 'reduces_bill': True},
+            {'start': date(2024, 3, 10), 'end': date(2024, 3, 11), 'length': 2, 'reduces_bill': False},
+        ])
+
+    def test_cached_until_the_student_changes(self):
+        bitmaps.student_calendar(self.students[0].id, 2024)
+        record_attendance(date(2024, 3, 20), [self.students[1].id])
+        with self.assertNumQueries(1):
+            calendar = bitmaps.student_calendar(self.students[0].id, 2024)
+        self.assertEqual(calendar['recorded_days'], 13)
+
+        with self.assertNumQueries(0):
+            bitmaps.student_calendar(self.students[0].id, 2024)
+        update_attendance(AttendanceDate.objects.get(date=date(2024, 3, 20)), [self.students[0].id])
+        self.assertEqual(bitmaps.student_calendar(self.students[0].id, 2024)['absent_days'], 12)
+
+    def test_view(self):
+        login_warden(self.client)
+        response = self.client.get(f'/days/{self.students[1].id}/calendar/?year=2024')
+        self.assertEqual(response.json()['months'][2]['absent'], [5])
+        self.assertEqual(response.json()['student']['name'], 'Student 1')
+        for year in ('x', '0', '-1', '10000', '99999'):
+            self.assertEqual(self.client.get(f'/days/{self.students[1].id}/calendar/?year={year}').status_code, 400)
+        for year in (1, 9999):
+            self.assertEqual(self.client.get(f'/days/{self.students[1].id}/calendar/?year={year}').json()['year'], year)
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        login_warden(self.client)
+        self.students = make_students(25)
+
+    def walk(self, url, name='page_obj'):
+        pages = [self.client.get(url).context[name]]
+        while pages[-1].has_next:
+            pages.append(self.client.get(f'{url}?after={pages[-1].next_cursor}').context[name])
+        return pages
+
+    def test_students_are_walked_by_cursor(self):
+        pages = self.walk('/get/')
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([student.id for page in pages for student in page], [student.id for student in self.students])
+
+        # the last page is the final ten rows, read backwards from the end
+        last = self.client.get('/get/?last=1').context['page_obj']
+        self.assertEqual(list(last), self.students[15:])
+        self.assertFalse(last.has_next)
+        previous = self.client.get(f'/get/?before={last.previous_cursor}').context['page_obj']
+        self.assertEqual(list(previous), self.students[5:15])
+
+    def test_page_cost_does_not_grow_and_total_is_cached(self):
+        response = self.client.get('/get/')
+        self.assertEqual(response.context['total_students'], 25)
+        self.assertContains(response, 'Showing 10 of 25')
+        cursor = response.context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/get/?after={cursor}')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+        Student.objects.filter(id=self.students[0].id).delete()
+        self.assertEqual(self.client.get('/get/').context['total_students'], 24)
+
+    def test_attendance_views_keep_filters(self):
+        for offset in range(10):
+            record_attendance(date(2024, 1, 1) + timedelta(days=offset), [student.id for student in self.students[:9]])
+        record_attendance(date(2024, 2, 1), [])
+        pages = self.walk('/summary/')
+        self.assertEqual([len(page) for page in pages], [8, 3])
+        self.assertEqual(pages[0].object_list[0].date, date(2024, 2, 1))
+
+        response = self.client.get('/summary/?month=January')
+        self.assertContains(response, '&month=January')
+        self.assertEqual(response.context['page_obj'].paginator.count, 10)
+
+        attendance_date = AttendanceDate.objects.get(date=date(2024, 1, 1))
+        pages = self.walk(f'/attendance/{attendance_date.id}/', 'absentees')
+        self.assertEqual([len(page) for page in pages], [7, 2])
+        self.assertEqual(pages[0].object_list[0].name.name, 'Student 0')
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        login_warden(self.client)
+
+    def populate(self, count, start):
+        students = make_students(count, start=start)
+        ids = [student.id for student in students]
+        attendance_date = record_attendance(date(2024, 5, 1) + timedelta(days=start), ids)
+        messbill = MessBill.objects.create(no_of_students=count, month='May', mess_days=31, mess_amount=1000,
+                                           room_rent=500, staff_salary=1000, electricity_bill=100,
+                                           total=1000, year=2000 + start)
+        ContinuousAbsence.objects.bulk_create([
+            ContinuousAbsence(bill_id=messbill, name_id=student_id, streak=8, month='May', year=2000 + start, period=period_key(2000 + start, 5))
+            for student_id in ids
+        ])
+        AbsenceStreak.objects.bulk_create([
+            AbsenceStreak(name_id=student_id, start_date=date(2024, 4, 1), last_date=date(2024, 4, 9), length=9)
+            for student_id in ids
+        ])
+        return attendance_date
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def test_pages_stay_within_budget(self):
+        small = self.populate(8, 0)
+        large = self.populate(30, 100)
+        for name, small_url, large_url in [
+            ('detailed_attendance', f'/attendance/{small.id}/', f'/attendance/{large.id}/'),
+            ('view_attendance', '/summary/?month=May', '/summary/'),
+            ('streak', '/streak?year=2000', '/streak?year=2100'),
+        ]:
+            cache.clear()
+            with self.subTest(name):
+                small_count = self.queries(small_url)
+                cache.clear()
+                large_count = self.queries(large_url)
+                self.assertEqual(small_count, large_count)
+                self.assertLessEqual(large_count, views.QUERY_BUDGETS[name])
+
+    def test_going_over_budget_is_logged(self):
+        attendance_date = self.populate(3, 0)
+        with patch.object(views.detailed_attendance, 'query_budget', 1):
+            with self.assertLogs('hostel.middleware', 'WARNING'):
+                self.client.get(f'/attendance/{attendance_date.id}/')
+
+
+class AttendanceDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        login_warden(self.client)
+        self.students = make_students(4)
+
+    def test_empty_attendance(self):
+        response = self.client.get('/attendance_dash')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'No attendance recorded yet')
+
+    def test_counters_are_cached_and_invalidated(self):
+        today = localtime().date()
+        record_attendance(today - timedelta(days=1), [self.students[0].id])
+        self.client.get('/attendance_dash')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/attendance_dash')
+        self.assertFalse(any('hostel_' in query['sql'] for query in queries.captured_queries))
+        self.assertFalse(response.context['attendance_taken'])
+        self.assertEqual(response.context['recent_absent'], 1)
+
+        record_attendance(today, [self.students[1].id, self.students[2].id])
+        response = self.client.get('/attendance_dash')
+        self.assertEqual((response.context['absent_count'], response.context['present_count']), (2, 2))
+        self.assertEqual(response.context['last_date'], today)
+
+        update_attendance(AttendanceDate.objects.get(date=today), [self.students[1].id])
+        self.assertEqual(self.client.get('/attendance_dash').context['absent_count'], 1)
+        Student.objects.filter(id=self.students[3].id).delete()
+        self.assertEqual(self.client.get('/attendance_dash').context['present_count'], 2)
+
+    def test_bump_from_another_process_invalidates(self):
+        # e.g. run_worker importing students, the cache is shared through CACHES
+        live = settings.BASE_DIR / 'cache'
+
+        def live_files():
+            return {path.name: path.stat().st_mtime_ns for path in live.glob('*')}
+
+        before = live_files()
+        self.client.get('/attendance_dash')
+        version = attendance_version()
+        subprocess.run([sys.executable, 'manage.py', 'shell', '-c',
+                        'from hostel.caching import bump_attendance_version; bump_attendance_version()'],
+                       cwd=settings.BASE_DIR, check=True, capture_output=True)
+        self.assertNotEqual(attendance_version(), version)
+        # the tests and the processes they start leave the server's cache alone
+        self.assertEqual(live_files(), before)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/attendance_dash')
+        self.assertTrue(any('hostel_' in query['sql'] for query in queries.captured_queries))
+
+
+class DashboardEventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.students = make_students(3)
+        room = Room.objects.create(room_number=1, floor='Ground', capacity=3)
+        Allotment.objects.create(room_number=room, name=self.students[0])
+        self.async_client.force_login(login_warden(self.client))
+
+    async def next_event(self, stream):
+        return (await asyncio.wait_for(anext(stream), 5)).decode()
+
+    async def test_counters_are_pushed_on_change(self):
+        with patch('hostel.events.POLL_INTERVAL', 0.01):
+            response = await self.async_client.get('/dashboard/events/')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = response.streaming_content
+            self.assertEqual(await self.next_event(stream), 'retry: 3000\n\n')
+
+            event = await self.next_event(stream)
+            self.assertTrue(event.startswith('event: counters\n'))
+            data = json.loads(event.split('data: ', 1)[1])
+            self.assertEqual(data['rooms']['available_slots'], 2)
+            self.assertFalse(data['attendance']['attendance_taken'])
+
+            await sync_to_async(record_attendance)(localtime().date(), [self.students[1].id])
+            data = json.loads((await self.next_event(stream)).split('data: ', 1)[1])
+            self.assertEqual((data['attendance']['present_count'], data['attendance']['absent_count']), (2, 1))
+
+            await sync_to_async(Allotment.objects.filter(name=self.students[0]).delete)()
+            data = json.loads((await self.next_event(stream)).split('data: ', 1)[1])
+            self.assertEqual(data['rooms']['available_slots'], 3)
+            await stream.aclose()
+
+    def test_streams_under_wsgi(self):
+        # the sync client goes through the WSGI path, events must arrive one by one
+        self.client.force_login(User.objects.get(username='warden'))
+        started = time.monotonic()
+        with patch('hostel.events.POLL_INTERVAL', 0.01), patch('hostel.events.STREAM_LIFETIME', 30):
+            response = self.client.get('/dashboard/events/')
+            stream = iter(response.streaming_content)
+            self.assertEqual(next(stream).decode(), 'retry: 3000\n\n')
+            self.assertTrue(next(stream).decode().startswith('event: counters\n'))
+            response.close()
+        self.assertLess(time.monotonic() - started, 5)
+
+    async def test_requires_login(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get('/dashboard/events/')
+        self.assertEqual(response.status_code, 403)
+
+
+class StudentSearchTests(TestCase):
+    def setUp(self):
+        login_warden(self.client)
+        dept = Department.objects.create(dept_name='Chemistry')
+        pgm = Programme.objects.create(pgm_name='MSc Chemistry', dept_id=dept)
+        self.anna = Student.objects.create(admn_no=5001, name='Anna Mathew', pgm=pgm, dob=date(2004, 1, 1),
+                                           email='anna@example.com', contact='9999999999', E_Grantz=False)
+        self.annie = Student.objects.create(admn_no=5002, name='Annie Joseph', pgm=pgm, dob=date(2004, 1, 1),
+                                            email='joseph@example.com', contact='9999999999', E_Grantz=False)
+        self.archived = Trash.objects.create(admn_no=4001, name='Anna Thomas', pgm=pgm, dob=date(2003, 1, 1),
+                                             email='thomas@example.com', contact='9999999999', E_Grantz=False,
+                                             date_joined=date(2021, 6, 1))
+        make_students(5)
+
+    def test_prefix_and_ranked(self):
+        self.assertEqual(set(search('ann', (STUDENT,))), {(STUDENT, self.anna.id), (STUDENT, self.annie.id)})
+        self.assertEqual(search('5002'), [(STUDENT, self.annie.id)])
+        self.assertEqual(set(search('chem anna')), {(STUDENT, self.anna.id), (ARCHIVED, self.archived.id)})
+        # a name match ranks above a match in the email only
+        self.assertEqual(search('joseph')[0], (STUDENT, self.annie.id))
+        self.assertEqual(search('"or* NEAR('), [])
+
+    def test_rows_are_keyed_by_kind_and_id(self):
+        # a student and an archived student with the same id have their own rowids
+        twin = Trash.objects.create(id=self.annie.id, admn_no=4002, name='Tara Twin', pgm=self.annie.pgm,
+                                    dob=date(2003, 1, 1), email='tara@example.com', contact='9999999999',
+                                    E_Grantz=False, date_joined=date(2021, 6, 1))
+        self.annie.save()
+        twin.save()
+        self.assertEqual(search('annie joseph'), [(STUDENT, self.annie.id)])
+        self.assertEqual(search('tara'), [(ARCHIVED, twin.id)])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid, kind, ref FROM hostel_student_fts WHERE ref = %s ORDER BY rowid", [twin.id])
+            self.assertEqual(cursor.fetchall(), [(twin.id * 2, STUDENT, twin.id), (twin.id * 2 + 1, ARCHIVED, twin.id)])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.anna.name = 'Meera Mathew'
+        self.anna.save()
+        self.assertEqual(search('meera'), [(STUDENT, self.anna.id)])
+        Programme.objects.filter(id=self.anna.pgm_id).update(pgm_name='MSc Biology')
+        self.anna.pgm.refresh_from_db()
+        self.anna.pgm.save()
+        self.assertEqual(len(search('biology')), 3)
+        self.client.get(f'/delete_student/{self.anna.id}/')
+        self.assertEqual([kind for kind, ref in search('meera')], [ARCHIVED])
+
+    def test_views(self):
+        response = self.client.get('/get/?search=anna')
+        self.assertEqual(list(response.context['page_obj']), [self.anna])
+        response = self.client.get('/inactive/?search=thom')
+        self.assertEqual(list(response.context['page_obj']), [self.archived])
+        results = self.client.get('/search/?q=anna').json()['results']
+        self.assertEqual({(result['kind'], result['admn_no']) for result in results}, {(STUDENT, 5001), (ARCHIVED, 4001)})
+        self.assertEqual(self.client.get('/search/?q=').json()['results'], [])
+
+    def test_filter_is_applied_before_the_limit(self):
+        # only matches on the email, so it ranks below the chemistry student named Anna
+        physics = Programme.objects.get(pgm_name='MSc Physics')
+        bob = Student.objects.create(admn_no=5003, name='Bob', pgm=physics, dob=date(2004, 1, 1),
+                                     email='anna.bob@example.com', contact='9999999999', E_Grantz=False)
+        in_physics = Student.objects.filter(pgm=physics)
+        self.assertEqual(search('anna', (STUDENT,), 1), [(STUDENT, self.anna.id)])
+        self.assertEqual(search_people(Student, in_physics, 'anna', limit=1), [bob])
+        self.assertEqual(count_people(Student, in_physics, 'anna'), 1)
+        self.assertEqual(count_people(Student, Student.objects.all(), 'anna'), 2)
+        response = self.client.get('/get/', {'search': 'anna', 'pgm': physics.id})
+        self.assertEqual((list(response.context['page_obj']), response.context['total_students']), ([bob], 1))
+
+    def test_rebuild_indexes_bulk_created_students(self):
+        self.assertEqual(search('student'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(search('student')), 5)
+
+
+def image_upload(name='photo.png', size=(400, 300), mode='RGB', format='PNG'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{format.lower()}')
+
+
+class PhotoProcessingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media.name))
+        self.student = make_students(1)[0]
+
+    def upload(self, upload):
+        self.student.photo = upload
+        self.student.save()
+        return self.student.photo.name
+
+    def test_upload_is_processed_by_the_worker(self):
+        raw_name = self.upload(image_upload(mode='RGBA'))
+        self.assertEqual(self.student.photo_status, Student.PHOTO_PROCESSING)
+        self.assertTrue(raw_name.endswith('.png'))
+
+        job = run_job(claim_next())
+        self.assertEqual(job.status, 'done')
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.photo_status, Student.PHOTO_READY)
+        self.assertTrue(self.student.photo.name.endswith('.webp'))
+        self.assertFalse(self.student.photo.storage.exists(raw_name))
+        with Image.open(self.student.photo.path) as img:
+            self.assertEqual((img.format, img.size), ('WEBP', (225, 300)))
+
+        # saving other fields does not process the photo again
+        self.student.name = 'Renamed'
+        self.student.save()
+        self.assertIsNone(claim_next())
+
+    def test_failure_is_recorded(self):
+        self.upload(SimpleUploadedFile('broken.png', b'not an image'))
+        job = run_job(claim_next())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('UnidentifiedImageError', job.error)
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.photo_status, Student.PHOTO_FAILED)
+
+    def test_replaced_upload_is_skipped(self):
+        first = self.upload(image_upload('first.png'))
+        second = self.upload(image_upload('second.png'))
+        self.assertEqual(run_job(claim_next()).result, {'skipped': True})
+        run_job(claim_next())
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.photo.name.startswith('images/second'))
+        self.assertFalse(self.student.photo.storage.exists(first))
+        self.assertTrue(self.student.photo.storage.exists(self.student.photo.name))
+
+    def test_archived_student_keeps_the_upload(self):
+        raw_name = self.upload(image_upload())
+        login_warden(self.client)
+        self.client.get(reverse('delete_student', args=[self.student.id]))
+        self.assertEqual(run_job(claim_next()).result, {'skipped': True})
+        self.assertEqual(Trash.objects.get().photo.name, raw_name)
+        self.assertTrue(default_storage.exists(raw_name))
+
+    def test_large_upload_is_decoded_at_stored_size(self):
+        self.upload(image_upload('big.png', size=(1600, 2400)))
+        run_job(claim_next())
+        self.student.refresh_from_db()
+        with Image.open(self.student.photo.path) as img:
+            self.assertEqual(img.size, (STORED_WIDTH, round(STORED_WIDTH * 4 / 3)))
+
+    def test_pixel_budget(self):
+        with patch('hostel.imaging.MAX_PIXELS', 100_000):
+            form = StudentForm(data={}, files={'photo': image_upload('photo.jpg', format='JPEG')})
+            self.assertIn('JPEG photos up to', form.errors['photo'][0])
+
+            self.upload(image_upload('photo.jpg', format='JPEG'))
+            job = run_job(claim_next())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('400x300', job.error)
+
+    def test_formats_decoded_whole_have_a_lower_budget(self):
+        # a PNG cannot be decoded at a reduced scale, so it is refused below the JPEG cap
+        with patch('hostel.imaging.MAX_PIXELS_FULL_DECODE', 100_000):
+            form = StudentForm(data={}, files={'photo': image_upload()})
+            self.assertIn('PNG photos up to', form.errors['photo'][0])
+            form = StudentForm(data={}, files={'photo': image_upload('photo.jpg', format='JPEG')})
+            self.assertNotIn('photo', form.errors)
+
+            self.upload(image_upload())
+            self.assertEqual(run_job(claim_next()).status, 'failed')
+
+    def test_resized_copies_are_served_with_long_cache(self):
+        self.upload(image_upload())
+        run_job(claim_next())
+        self.student.refresh_from_db()
+        storage = self.student.photo.storage
+        for size, width in PHOTO_SIZES.items():
+            with Image.open(storage.path(f'{VARIANT_DIR}/{self.student.photo_hash}-{size}.webp')) as img:
+                self.assertEqual(img.width, min(width, 225))
+
+        url = photo_url(self.student, 'avatar')
+        self.assertTrue(url.endswith(f'{self.student.photo_hash}-avatar.webp'))
+        login_warden(self.client)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('photo_variant', args=['secret-avatar.webp'])).status_code, 404)
+
+    def test_backfill_command(self):
+        # a photo stored before resized copies existed
+        self.student.photo = image_upload()
+        Student.objects.filter(id=self.student.id).update(photo=self.student.photo.storage.save('images/old.png', self.student.photo))
+        self.assertEqual(photo_url(Student.objects.get(id=self.student.id), 'card'), '/media/images/old.png')
+
+        call_command('build_photo_variants', stdout=StringIO())
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.photo_hash)
+        self.assertTrue(self.student.photo.storage.exists(f'{VARIANT_DIR}/{self.student.photo_hash}-card.webp'))
+
+        Student.objects.update(photo_hash='')
+        call_command('build_photo_variants', '--prune', stdout=StringIO())
+        self.assertEqual(len(self.student.photo.storage.listdir(VARIANT_DIR)[1]), len(PHOTO_SIZES))
+
+
+@patch('hostel.imports.PHOTO_WORKERS', 1)
+class StudentImportTests(TestCase):
+    header = 'admn_no,name,programme,dob,email,contact,category,e_grantz,photo\n'
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        private = tempfile.TemporaryDirectory()
+        self.addCleanup(private.cleanup)
+        imports = dict(settings.STORAGES['imports'], OPTIONS={'location': private.name})
+        self.enterContext(self.settings(MEDIA_ROOT=media.name, STORAGES=dict(settings.STORAGES, imports=imports)))
+        make_students(1)
+
+    def rows(self, count, start=5000):
+        return ''.join(f'{start + i},New {i},msc physics,2005-06-0{i % 9 + 1},n{i}@example.com,9876543210,OBC,yes,\n'
+                       for i in range(count))
+
+    def archive(self, members):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+        buffer.seek(0)
+        return buffer
+
+    def test_rows_are_validated_and_added(self):
+        lines = StringIO(self.header + self.rows(2) + (
+            '1000,Taken,MSc Physics,2005-01-01,t@example.com,9876543210,,no,\n'
+            '5000,Twice,MSc Physics,2005-01-01,t@example.com,9876543210,,no,\n'
+            '6000,Lost,Chemistry,2005-01-01,l@example.com,9876543210,,no,\n'
+            '6001,Bad,MSc Physics,2005-01-01,not-an-email,12,,no,\n'
+            '6002,Missing,MSc Physics,2005-01-01,m@example.com,9876543210,,no,missing.jpg\n'
+        ))
+        report = import_students(lines)
+        self.assertEqual(report['students'], 2)
+        self.assertEqual([line for line, reason in report['rejected']], [4, 5, 6, 7, 8])
+        self.assertIn('already exists', report['rejected'][0][1])
+        self.assertIn('Unknown programme', report['rejected'][2][1])
+        self.assertIn('email', report['rejected'][3][1])
+
+        student = Student.objects.get(admn_no=5001)
+        self.assertEqual((student.category, student.E_Grantz, student.date_joined), ('OBC', True, date.today()))
+        self.assertEqual({ref for kind, ref in search('new')}, set(Student.objects.filter(admn_no__gte=5000).values_list('id', flat=True)))
+        self.assertFalse(Job.objects.exists())
+
+    def test_queries_do_not_grow_with_rows(self):
+        def queries(count, start):
+            with CaptureQueriesContext(connection) as context:
+                import_students(StringIO(self.header + self.rows(count, start)))
+            return len(context)
+        self.assertEqual(queries(3, 5000), queries(60, 6000))
+
+    def test_photos_from_archive(self):
+        png = image_upload().read()
+        archive = self.archive({'photos/5000.png': png, 'custom.PNG': png, '5002.png': b'broken'})
+        rows = self.rows(3).replace('n1@example.com,9876543210,OBC,yes,', 'n1@example.com,9876543210,OBC,yes,custom.png')
+        report = import_students(StringIO(self.header + rows), zipfile.ZipFile(archive))
+        self.assertEqual((report['students'], report['photos']), (3, 2))
+        self.assertEqual(report['photo_errors'][0][0], 5002)
+
+        student = Student.objects.get(admn_no=5000)
+        self.assertEqual(student.photo_status, Student.PHOTO_READY)
+        self.assertTrue(student.photo.name.endswith('.webp'))
+        self.assertTrue(student.photo.storage.exists(f'{VARIANT_DIR}/{student.photo_hash}-avatar.webp'))
+        self.assertFalse(Student.objects.get(admn_no=5002).photo)
+
+    def test_photos_rendered_by_the_pool(self):
+        png = image_upload().read()
+        archive = self.archive({'5000.png': png, '5001.png': png, '5002.png': b'broken'})
+        with transaction.atomic():
+            report = import_students(StringIO(self.header + self.rows(3)), zipfile.ZipFile(archive), workers=2)
+        self.assertEqual((report['students'], report['photos']), (3, 2))
+        self.assertEqual(report['photo_errors'][0][0], 5002)
+        student = Student.objects.get(admn_no=5001)
+        self.assertEqual(student.photo_status, Student.PHOTO_READY)
+        self.assertTrue(student.photo.storage.exists(student.photo.name))
+
+    def test_failed_chunk_removes_its_photos(self):
+        png = image_upload().read()
+        archive = self.archive({'5000.png': png, '5001.png': png})
+        with patch('hostel.imports.index_people', side_effect=RuntimeError('index is locked')):
+            with self.assertRaises(RuntimeError):
+                import_students(StringIO(self.header + self.rows(2)), zipfile.ZipFile(archive))
+        self.assertFalse(Student.objects.filter(admn_no__gte=5000).exists())
+        self.assertFalse(default_storage.exists('images/5000.webp'))
+        self.assertFalse(default_storage.exists('images/5001.webp'))
+
+    def test_upload_runs_in_the_worker(self):
+        login_warden(self.client)
+        response = self.client.post(reverse('import_students'), {
+            'file': SimpleUploadedFile('batch.csv', (self.header + self.rows(2)).encode()),
+            'photos': SimpleUploadedFile('photos.zip', self.archive({'5000.png': image_upload().read()}).getvalue()),
+        })
+        job = Job.objects.get(kind='import_students')
+        self.assertRedirects(response, f"{reverse('import_students')}?job={job.id}")
+        # the uploads wait outside MEDIA_ROOT, which is served at /media/
+        csv_path = storages['imports'].path(job.payload['csv'])
+        self.assertTrue(os.path.exists(csv_path))
+        self.assertFalse(csv_path.startswith(str(settings.MEDIA_ROOT)))
+
+        job = run_job(claim_next())
+        self.assertEqual(job.result['students'], 2)
+        self.assertFalse(storages['imports'].exists(job.payload['csv']))
+        self.assertFalse(storages['imports'].exists(job.payload['photos']))
+        response = self.client.get(reverse('import_students'), {'job': job.id})
+        self.assertContains(response, 'Added 2 students with 1 photo.')
@@ -6,11 +6,15 @@ urlpatterns = [
     path('access_denied',views.access_denied,name='access_denied'),
     path('std_dash',views.student_dashboard,name='student_dashboard'),
     path('get/',views.view_students,name='view_student'),
+    path('search/',views.search_students,name='search_students'),
     path('inactive/',views.inactive_students,name='inactive_student'),
     path('inact_details<int:student_id>/',views.view_inactive_details,name='view_inactive_details'),
+    path('photos/<str:name>',views.photo_variant,name='photo_variant'),
     path('add/',views.add_student,name='add_student'),
+    path('students/import/',views.import_students,name='import_students'),
     path('view/<int:student_id>/',views.view_details,name='view_details'),
     path('days/<int:student_id>/',views.absent_records,name='absent_records'),
+    path('days/<int:student_id>/calendar/',views.attendance_calendar,name='attendance_calendar'),
     path('edit_student/<int:student_id>/',views.edit_student,name='edit_student'),
     path('delete_student/<int:student_id>/',views.delete_student,name='delete_student'),
     path('room_dash',views.room_dashboard,name='room_dashboard'),
@@ -18,15 +22,22 @@ urlpatterns = [
     path('allotements/',views.view_allotement,name='view_allotement'),
     path('roomList',views.room_list,name='room_list'),
     path('attendance_dash',views.attendance_dashboard,name='attendance_dashboard'),
+    path('dashboard/events/',views.dashboard_events,name='dashboard_events'),
     path('attendance/',views.mark_attendance,name='mark_attendance'),
     path('summary/',views.view_attendance,name='view_attendance'),
     path('attendance/<int:date_id>/',views.detailed_attendance, name='attendance_detail'),
+    path('edit_att/<int:date_id>/',views.edit_attendance,name='edit_attendance'),
+    path('attendance/roster/',views.attendance_roster,name='attendance_roster'),
+    path('attendance/import/',views.import_attendance,name='import_attendance'),
     path('delete_att/<int:date_id>/',views.delete_attendance,name='delete_attendance'),
     path('streak',views.streak,name='streak'),
     path('delete_allocation/<str:student_name>/',views.delete_allocation,name='delete_allocation'),
     path('bill_dashboard',views.bill_dashboard,name='bill_dashboard'),
     path('messbill',views.generate_mess_bill,name='generate_mess_bill'),
+    path('jobs/<int:job_id>/',views.job_status,name='job_status'),
     path('totalbill',views.total_bill,name='total_bill'),
+    path('totalbill/export/<str:fmt>/',views.export_total_bill,name='export_total_bill'),
     path('deletebill/<int:pk>/',views.delete_bill,name='delete_bill'),
     path('monthlybills/<str:month>/<int:year>/',views.view_monthly_bill,name='view_monthly_bill'),
+    path('monthlybills/<str:month>/<int:year>/export/<str:fmt>/',views.export_monthly_bill,name='export_monthly_bill'),
 ]
\ No newline at end of file
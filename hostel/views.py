@@ -1,20 +1,48 @@
 from django.shortcuts import redirect,render,get_object_or_404
+from django.urls import reverse
 from .models import *
 from .forms import *
 from django.contrib.auth.decorators import login_required
-from datetime import timedelta,datetime
+from datetime import MAXYEAR, MINYEAR, timedelta,datetime
 from django.contrib import messages
 from django.core.exceptions import ValidationError
-from django.core.files.storage import default_storage
+from django.core.files.storage import default_storage, storages
 from django.conf import settings
-from collections import defaultdict
-from .decorators import group_required
+from .decorators import group_required, query_budget
 from .filters import *
+from .jobs import enqueue
+from .billing import billed_e_grantz, preview_bill
+from .exports import export_response
+from django.http import FileResponse, Http404, HttpResponseForbidden, StreamingHttpResponse
+from .events import counter_events, counter_events_sync, room_counters
+from django.core.handlers.asgi import ASGIRequest
+from .pagination import KeysetPage, KeysetPaginator, query_params
+from .search import ARCHIVED, STUDENT, count_people, search, search_people
+from django.http import JsonResponse
+from django.views.decorators.http import condition
+from django.utils.cache import patch_cache_control
+from .caching import attendance_version
+from .streaks import MIN_STREAK
+from .attendance import record_attendance, delete_attendance_date, update_attendance, dashboard_counters
+from .bitmaps import all_absent_dates, student_calendar
+from .imports import import_attendance as load_absences, import_format
+from .photos import PHOTO_SIZES, VARIANT_DIR, photo_url
+import io
+import re
 from django.utils import timezone
 from django.core.paginator import Paginator
 from django.utils.timezone import localtime
 
 
+# queries per request for the list pages, including the session and user lookups.
+# A page that shows more rows must not run more queries
+QUERY_BUDGETS = {
+    'detailed_attendance': 6,
+    'view_attendance': 5,
+    'streak': 6,
+}
+
+
 def access_denied(request):
     return render(request,'hostel/access_denied.html')
 
@@ -73,22 +101,21 @@ def add_student(request):
 @group_required('warden', login_url='access_denied')  #new
 def view_students(request):
     try:
-        stud = Student.objects.select_related('pgm').order_by('id')
-
+        stud = Student.objects.select_related('pgm')
         students_filter = studentFilter(request.GET, queryset=stud)
         filtered_students = students_filter.qs
 
         search_query = request.GET.get('search', '')
         if search_query:
-            filtered_students = filtered_students.filter(name__icontains=search_query)
-
-        total_students = filtered_students.count()
-
-        paginator = Paginator(filtered_students, 10)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+            # ranked full-text matches, best first, on one page
+            page_obj = KeysetPage(search_people(Student, filtered_students, search_query), False, False, None, None)
+            total_students = count_people(Student, filtered_students, search_query)
+        else:
+            paginator = KeysetPaginator(filtered_students, ['id'], 10)
+            page_obj = paginator.get_page_from_request(request)
+            total_students = paginator.count
 
-        if not filtered_students.exists():
+        if not page_obj and not page_obj.has_previous:
             messages.error(request, "Currently there are no students")
 
         return render(request, 'hostel/students.html', {
@@ -96,20 +123,41 @@ def view_students(request):
             'page_obj': page_obj,
             'total_students': total_students,
             'search_query': search_query,
-            'student':stud
+            'query_params': query_params(request),
         })
     except Exception:
         return render(request,'hostel/error.html')
 
 
+@group_required('warden', login_url='access_denied')
+def search_students(request):
+    # active and archived students in one ranked list
+    matches = search(request.GET.get('q', ''))
+    people = {
+        STUDENT: Student.objects.select_related('pgm').in_bulk([ref for kind, ref in matches if kind == STUDENT]),
+        ARCHIVED: Trash.objects.select_related('pgm').in_bulk([ref for kind, ref in matches if kind == ARCHIVED]),
+    }
+    results = []
+    for kind, ref in matches:
+        person = people[kind].get(ref)
+        if person:
+            results.append({
+                'kind': kind,
+                'id': person.id,
+                'name': person.name,
+                'admn_no': person.admn_no,
+                'programme': person.pgm.pgm_name,
+                'url': reverse('view_details' if kind == STUDENT else 'view_inactive_details', args=[person.id]),
+            })
+    return JsonResponse({'results': results})
+
+
 @group_required('warden', login_url='access_denied')
 def view_details(request, student_id):
     try:
         student = Student.objects.filter(id=student_id).select_related('pgm').first()
         room = Allotment.objects.filter(name_id=student_id).select_related('room_number').first()
-        student_image_url = None
-        if student and student.photo:
-            student_image_url = settings.MEDIA_URL + str(student.photo)
+        student_image_url = photo_url(student, 'card') if student else None
         return render(request, "hostel/details.html", {'student': student, 'student_image_url': student_image_url,'room':room})
     except Exception:
         return render(request,'hostel/error.html')
@@ -117,21 +165,21 @@ def view_details(request, student_id):
 @group_required('warden', login_url='access_denied')
 def inactive_students(request):
     try:
-        stud = Trash.objects.select_related('pgm').order_by('id')
+        stud = Trash.objects.select_related('pgm')
         students_filter = studentFilter(request.GET, queryset=stud)
         filtered_students = students_filter.qs
 
         search_query = request.GET.get('search', '')
         if search_query:
-            filtered_students = filtered_students.filter(name__icontains=search_query)
-
-        total_students = filtered_students.count()
-
-        paginator = Paginator(filtered_students, 10)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+            # ranked full-text matches, best first, on one page
+            page_obj = KeysetPage(search_people(Trash, filtered_students, search_query), False, False, None, None)
+            total_students = count_people(Trash, filtered_students, search_query)
+        else:
+            paginator = KeysetPaginator(filtered_students, ['id'], 10)
+            page_obj = paginator.get_page_from_request(request)
+            total_students = paginator.count
 
-        if not filtered_students.exists():
+        if not page_obj and not page_obj.has_previous:
             messages.error(request, "Currently there are no students")
 
         return render(request, 'hostel/inact_students.html', {
@@ -139,7 +187,7 @@ def inactive_students(request):
             'page_obj': page_obj,
             'total_students': total_students,
             'search_query': search_query,
-            'student':stud
+            'query_params': query_params(request),
         })
     except Exception:
         return render(request,'hostel/error.html')
@@ -149,14 +197,28 @@ def inactive_students(request):
 def view_inactive_details(request, student_id):
     try:
         student = Trash.objects.filter(id=student_id).select_related('pgm').first()
-        student_image_url = None
-        if student and student.photo:
-            student_image_url = settings.MEDIA_URL + str(student.photo)
+        student_image_url = photo_url(student, 'card') if student else None
         return render(request, "hostel/inact_details.html", {'student': student, 'student_image_url': student_image_url})
     except Exception:
         return render(request,'hostel/error.html')
 
 
+# resized photos are named after their content, so browsers may keep them for a year
+PHOTO_MAX_AGE = 60 * 60 * 24 * 365
+
+
+@group_required('warden', login_url='access_denied')
+def photo_variant(request, name):
+    if not re.fullmatch(r'[0-9a-f]{16}-(%s)\.webp' % '|'.join(PHOTO_SIZES), name):
+        raise Http404
+    path = f'{VARIANT_DIR}/{name}'
+    if not default_storage.exists(path):
+        raise Http404
+    response = FileResponse(default_storage.open(path), content_type='image/webp')
+    patch_cache_control(response, private=True, max_age=PHOTO_MAX_AGE, immutable=True)
+    return response
+
+
 @group_required('warden', login_url='access_denied')
 def edit_student(request, student_id):
     try:
@@ -217,6 +279,7 @@ def delete_student(request,student_id):
             dob=student.dob,
             email=student.email,
             photo=student.photo,
+            photo_hash=student.photo_hash,
             contact=student.contact,
             date_joined=student.date_joined,
             date_exited=timezone.now(),
@@ -237,15 +300,7 @@ def delete_student(request,student_id):
 @group_required('warden', login_url='access_denied')
 def room_dashboard(request):
     try:
-        total_rooms = Room.objects.count()
-        total_capacity = Room.objects.aggregate(total_capacity=models.Sum('capacity'))['total_capacity'] or 0
-        current_allotted = Allotment.objects.count()
-        available_slots = total_capacity - current_allotted
-
-        context = {
-            'total_rooms': total_rooms,
-            'available_slots': available_slots
-        }
+        context = room_counters()
 
         return render(request, 'hostel/room_dashboard.html', context)
 
@@ -289,18 +344,13 @@ def delete_allocation(request,student_name):
 @group_required('warden', login_url='access_denied')
 def view_allotement(request):
     try:
-        filter = roomFilter(request.GET, queryset=Allotment.objects.select_related('room_number', 'name').order_by('room_number'))
+        filter = roomFilter(request.GET, queryset=Allotment.objects.select_related('room_number', 'name'))
         alloted_list = filter.qs
 
-        paginator = Paginator(alloted_list, 6)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-
-        query_params = request.GET.copy()
-        if 'page' in query_params:
-            query_params.pop('page')
+        paginator = KeysetPaginator(alloted_list, ['room_number__room_number', 'id'], 6)
+        page_obj = paginator.get_page_from_request(request)
 
-        return render(request, 'hostel/allotements.html', {'alloted': page_obj, 'filter': filter, 'query_params': query_params})
+        return render(request, 'hostel/allotements.html', {'alloted': page_obj, 'filter': filter, 'query_params': query_params(request)})
     except Exception:
         return render(request,'hostel/error.html')
 
@@ -328,36 +378,21 @@ def room_list(request):
     return render(request, "hostel/roomList.html", context)
 
 # Attendance functions
+async def dashboard_events(request):
+    # login_required does not wrap async views yet, so the check is done here
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    # an async stream under ASGI, a sync one under WSGI, see events.py
+    events = counter_events() if isinstance(request, ASGIRequest) else counter_events_sync()
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required()
 def attendance_dashboard(request):
-    today = localtime().date()
-    total_students = Student.objects.count()
-
-    last_attendance = AttendanceDate.objects.last()
-    last_date = last_attendance.date
-    date_id = last_attendance.id
-    recent_absent = Attendance.objects.filter(date=date_id).count()
-
-    # Check today's attendance
-    attendance_date = AttendanceDate.objects.filter(date=today).first()
-
-    if attendance_date:
-        attendance_taken = True
-        absent_count = Attendance.objects.filter(date=attendance_date).count()
-        present_count = total_students - absent_count
-        attendance_percentage = round((present_count / total_students) * 100, 2) if total_students > 0 else 0
-    else:
-        attendance_taken = False
-        present_count = absent_count = attendance_percentage = None
-
-    context = {
-        'attendance_taken': attendance_taken,
-        'present_count': present_count,
-        'absent_count': absent_count,
-        'attendance_percentage': attendance_percentage,
-        'recent_absent': recent_absent, 
-        'last_date':last_date
-    }
+    context = dashboard_counters(localtime().date())
     return render(request, 'hostel/attendance_dashboard.html', context)
 
 
@@ -369,73 +404,128 @@ def mark_attendance(request):
             form = AttendanceForm(request.POST)
             if form.is_valid():
                 date = form.cleaned_data['date']
-                if AttendanceDate.objects.filter(date=date).exists():
-                    messages.error(request, f"Attendance has already been recorded for {date}")
-                else:
-                    month = date.strftime('%B')
-                    year = date.year
-                    attendance_date_obj = AttendanceDate(date=date,month=month,year=year)
-                    attendance_date_obj.save()
-
-                    absentees = form.cleaned_data['absentees']
-                    for absentee in absentees:
-                        stud = Student.objects.get(name=absentee)
-                        att = AttendanceDate.objects.get(date=date)
-                        absenti = Attendance(date=att,name=stud)
-                        absenti.save()
+                try:
+                    record_attendance(date, form.cleaned_data['absentees'])
                     messages.success(request, f"Attendance for {date} recorded successfully.")
+                except ValueError as e:
+                    messages.error(request, str(e))
         else:
             form=AttendanceForm()
-        students = Student.objects.all()
-        return render(request,"hostel/attendance.html",{'form':form,'students':students})
+        return render(request,"hostel/attendance.html",{'form':form})
     except Exception:
         return render(request,'hostel/error.html')
 
 
+def roster_etag(request):
+    return f'"roster-{attendance_version()}"'
+
+@login_required()
+@condition(etag_func=roster_etag)
+def attendance_roster(request):
+    # compact rows of [id, name, room] for the absentee picker
+    students = Student.objects.order_by('name').values_list('id', 'name', 'allotment__room_number__room_number')
+    return JsonResponse({'students': [list(student) for student in students]})
+
+
+@query_budget(QUERY_BUDGETS['view_attendance'])
 @login_required()
 def view_attendance(request):
-    filter = attendanceFilter(request.GET, queryset=AttendanceDate.objects.all().order_by('-date'))
+    filter = attendanceFilter(request.GET, queryset=AttendanceDate.objects.all())
     attendance_list = filter.qs
 
     # Pagination
-    paginator = Paginator(attendance_list, 8)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    # for filter
-    query_params = request.GET.copy()
-    if 'page' in query_params:
-        query_params.pop('page')
+    paginator = KeysetPaginator(attendance_list, ['-date'], 8)
+    page_obj = paginator.get_page_from_request(request)
 
-    return render(request, "hostel/summary.html", {'page_obj': page_obj, 'filter': filter, 'query_params': query_params})
+    return render(request, "hostel/summary.html", {'page_obj': page_obj, 'filter': filter, 'query_params': query_params(request)})
 
+@query_budget(QUERY_BUDGETS['detailed_attendance'])
 @login_required()
 def detailed_attendance(request, date_id):
     try:
         attendance_date = get_object_or_404(AttendanceDate, id=date_id)        
-        absentees = Attendance.objects.filter(date=attendance_date)
-        total_absentees = absentees.count()
+        absentees = Attendance.objects.filter(date=attendance_date).select_related('name').only('name__name')
 
-        paginator = Paginator(absentees, 7)  
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        paginator = KeysetPaginator(absentees, ['name__name', 'id'], 7)
+        page_obj = paginator.get_page_from_request(request)
 
         context = {
             'date': attendance_date,
             'absentees': page_obj,
-            'total_absentees': total_absentees,
+            'total_absentees': paginator.count,
+            'query_params': query_params(request),
         }
         return render(request, "hostel/attendance_detail.html", context)
 
     except Exception:
         return render(request, 'hostel/error.html')
 
+@login_required()
+def edit_attendance(request, date_id):
+    try:
+        attendance_date = get_object_or_404(AttendanceDate, id=date_id)
+        initial = {
+            'date': attendance_date.date,
+            'absentees': list(attendance_date.attendance_set.values_list('name_id', flat=True)),
+        }
+        if request.method == "POST":
+            form = EditAttendanceForm(request.POST, initial=initial)
+            if form.is_valid():
+                added, removed = update_attendance(attendance_date, form.cleaned_data['absentees'])
+                messages.success(request, f"Attendance for {attendance_date.date} updated: {len(added)} marked absent, {len(removed)} marked present.")
+                return redirect('attendance_detail', attendance_date.id)
+        else:
+            form = EditAttendanceForm(initial=initial)
+        return render(request,"hostel/attendance.html",{'form':form,'editing':attendance_date})
+    except Exception:
+        return render(request,'hostel/error.html')
+
+@group_required('warden', login_url='access_denied')
+def import_attendance(request):
+    report = None
+    if request.method == "POST":
+        form = AttendanceImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            # read the upload line by line instead of loading it into memory
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+            try:
+                report = load_absences(lines, import_format(upload.name))
+                messages.success(request, f"Imported {report['absences']} absences over {report['dates']} new dates.")
+            except (ValueError, UnicodeDecodeError) as e:
+                messages.error(request, f"Could not import the file: {e}")
+    else:
+        form = AttendanceImportForm()
+    return render(request, "hostel/attendance_import.html", {'form': form, 'report': report})
+
+@group_required('warden', login_url='access_denied')
+def import_students(request):
+    if request.method == "POST":
+        form = StudentImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # the students and photos are added by the background worker, the page polls its progress
+            # they hold personal details, so they are kept outside MEDIA_ROOT (see STORAGES)
+            upload, photos = form.cleaned_data['file'], form.cleaned_data['photos']
+            storage = storages['imports']
+            job = enqueue(
+                'import_students',
+                csv=storage.save(upload.name, upload),
+                photos=storage.save(photos.name, photos) if photos else None,
+            )
+            return redirect(f"{reverse('import_students')}?job={job.id}")
+        messages.error(request, "Make sure your entries are correct.")
+    else:
+        form = StudentImportForm()
+    job = Job.objects.filter(id=request.GET.get('job'), kind='import_students').first() if request.GET.get('job', '').isdigit() else None
+    error = job.error.strip().splitlines()[-1] if job and job.error else ''
+    return render(request, "hostel/student_import.html", {'form': form, 'job': job, 'error': error})
+
 @login_required()
 def delete_attendance(request, date_id):
     try:
         attendance_instance = get_object_or_404(AttendanceDate, id=date_id)
         if request.method == "GET":
-            attendance_instance.delete()
+            delete_attendance_date(attendance_instance)
             messages.success(request, f"Deleted successfully.")
             return redirect('view_attendance')
         else:
@@ -447,7 +537,8 @@ def delete_attendance(request, date_id):
 @group_required('warden', login_url='access_denied')
 def absent_records(request, student_id):
     student = get_object_or_404(Student,id=student_id)
-    absences = Attendance.objects.filter(name=student).select_related('date').order_by('date__date')
+    # read from the monthly bitmaps, one row per month instead of one per absence
+    absences = all_absent_dates(student.id)
 
     paginator = Paginator(absences,5)
     page_number = request.GET.get('page')
@@ -455,65 +546,26 @@ def absent_records(request, student_id):
 
     return render(request,"hostel/absent_days.html",{'student':student,'page_obj':page_obj})
 
+@group_required('warden', login_url='access_denied')
+def attendance_calendar(request, student_id):
+    student = get_object_or_404(Student,id=student_id)
+    try:
+        year = int(request.GET.get('year', localtime().year))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid year'}, status=400)
+    if not MINYEAR <= year <= MAXYEAR:
+        return JsonResponse({'error': 'Invalid year'}, status=400)
+    calendar = student_calendar(student.id, year)
+    return JsonResponse({'student': {'id': student.id, 'name': student.name}, **calendar})
+
 # mess bill functions
 
 @group_required('warden', login_url='access_denied')
 def bill_dashboard(request):
-        last_bill = MessBill.objects.last()
+        last_bill = MessBill.objects.select_related('summary').order_by('id').last()
         return render(request, "hostel/bill_dashboard.html", {'bill':last_bill})
 
 
-#function to find continuous absences
-def find_continuous_absences(start_date, end_date):
-    absences = Attendance.objects.filter(date__date__range=(start_date, end_date)).order_by('name', 'date__date')
-    
-    #Initialize a dictionary to store the continuous absences for each student
-    continuous_absences = defaultdict(int)
-
-    current_student = None
-    current_streak = 0
-    last_date = None
-
-    for absence in absences:
-
-        #new
-        stud = absence.name
-        if stud.E_Grantz: # Skip students with eGrantz
-            continue
-
-        student_id = absence.name.id
-        absence_date = absence.date.date
-
-        # Check if the current absence record belongs to a different student
-        if current_student != student_id:
-            # If the previous student had a streak of 7 or more absences, add it to the dictionary
-            if current_streak >= 7:
-                continuous_absences[current_student] += current_streak
-            
-            # Update current student and reset streak for the new student
-            current_student = student_id
-            current_streak = 1
-            last_date = absence_date
-        else:
-            # Check if the current absence is continuous with the previous one
-            if absence_date == last_date + timedelta(days=1):
-                current_streak += 1
-            else:
-                # If the absence is not continuous, check if the streak is 7 or more
-                if current_streak >= 7:
-                    continuous_absences[current_student] += current_streak
-                # Reset the streak for the new absence streak
-                current_streak = 1
-            # Update the last absence date for the current student
-            last_date = absence_date
-    
-    # Final check for the last student in the list
-    if current_streak >= 7:
-        continuous_absences[current_student] += current_streak
-    
-    return dict(continuous_absences)
-
-
 @group_required('warden', login_url='access_denied')
 def generate_mess_bill(request):
     if request.method == "POST":
@@ -523,103 +575,61 @@ def generate_mess_bill(request):
             end_date = form.cleaned_data['end_date']
 
             if AttendanceDate.objects.filter(date=start_date).exists() and AttendanceDate.objects.filter(date=end_date).exists():
-                number_of_students = Student.objects.count()
-                total_mess_amount = form.cleaned_data['total_mess_amount']
-                room_rent = form.cleaned_data['room_rent']
-                staff_salary = form.cleaned_data['staff_salary']
-                electricity_bill = form.cleaned_data['electricity_bill']
-
-                total = total_mess_amount + (room_rent*number_of_students) + staff_salary + electricity_bill
-
-                year = start_date.year
                 month = start_date.strftime('%B')
-
-                reduction_days = 0
-                sum = 0
-
-                existing_bill = MessBill.objects.filter(month=month,year=year).exists()
-                if existing_bill:
-                    messages.error(request,f"Bill for {month}, {year} already exists")
+                if 'preview' in request.POST:
+                    # dry run, the warden can try other amounts before generating the bill
+                    try:
+                        preview = preview_bill(
+                            start_date,
+                            end_date,
+                            form.cleaned_data['total_mess_amount'],
+                            form.cleaned_data['room_rent'],
+                            form.cleaned_data['staff_salary'],
+                            form.cleaned_data['electricity_bill'],
+                        )
+                        return render(request, "hostel/billform.html", {'form': form, 'preview': preview})
+                    except ValueError as e:
+                        messages.error(request,str(e))
+                elif MessBill.objects.filter(period=period_of(start_date)).exists():
+                    messages.error(request,f"Bill for {month}, {start_date.year} already exists")
                 else:
-                    mess_days = (end_date-start_date).days + 1
-
-                    messbill = MessBill(
-                        no_of_students=number_of_students,
-                        month=month,
-                        mess_days=mess_days,
-                        mess_amount=total_mess_amount,
-                        room_rent=room_rent,
-                        staff_salary=staff_salary,
-                        electricity_bill=electricity_bill,
-                        total=total,
-                        year=year
+                    # the bill is written by the background worker, the page polls its progress
+                    job = enqueue(
+                        'generate_bill',
+                        start_date=start_date.isoformat(),
+                        end_date=end_date.isoformat(),
+                        total_mess_amount=str(form.cleaned_data['total_mess_amount']),
+                        room_rent=str(form.cleaned_data['room_rent']),
+                        staff_salary=str(form.cleaned_data['staff_salary']),
+                        electricity_bill=str(form.cleaned_data['electricity_bill']),
                     )
-                    messbill.save()
-                    bill_id = get_object_or_404(MessBill, month=month,year=year)
-
-
-                    streak = find_continuous_absences(start_date, end_date)
-
-                    #just for printing the continuouse absentees in the terminal
-                    for student_id, days_absent in streak.items():
-                        stud = get_object_or_404(Student, id=student_id)
-                        continous_absent = ContinuousAbsence(bill_id=bill_id,name=stud,streak=days_absent,month=month,year=year)
-                        continous_absent.save()
-                        #print(f"Student ID: {student_id}, Continuous Absences: {days_absent}")
-
-                    for value in streak.values():
-                        reduction_days += value
-                    
-                    total_mess_days = (mess_days * number_of_students) - reduction_days 
-                    mess_bill_per_day = total_mess_amount/total_mess_days 
-                    other_expenses_per_student = ((room_rent*number_of_students) + (staff_salary + electricity_bill)) / number_of_students 
-                    
-                    #new
-                    est = 300
-                    other_expenses_per_student_4_egrantz = (((room_rent*number_of_students) + (staff_salary + electricity_bill)) / number_of_students ) + est
-
-
-                    #printing every details on the terminal
-                    print(f"Start date: {start_date}")
-                    print(f"End date: {end_date}")
-                    print(f"Total students: {number_of_students}")
-                    print(f"Total mess amount: {total_mess_amount}")
-                    print(f"Total mess working days: {mess_days}")
-                    print(f"Total mess reduction days: {reduction_days}")
-                    print(f"Total mess days after reduction: {total_mess_days}")
-                    print(f"Mess bill per day: {mess_bill_per_day}")
-                    print(f"Other expenses per student: {other_expenses_per_student}")
-                    print(f"Other expenses per student: {other_expenses_per_student_4_egrantz}")
-
-                    students = Student.objects.all()
-
-                    for student in students:
-                        if student.id in streak:
-                            name_id = student.id
-                            days_present = mess_days - (streak[name_id])
-                            mess_bill = round((mess_bill_per_day*days_present)+other_expenses_per_student,2)
-                            #print(f"Mess bill of {student} is {mess_bill}")
-                            sum += mess_bill
-                            student_bill = StudentBill(bill_id=bill_id,name=student,total=mess_bill,month=month,year=year)
-                            student_bill.save()
-                        else:
-                            name_id = student.id
-                            days_present = mess_days
-                            mess_bill = round((mess_bill_per_day*days_present)+other_expenses_per_student_4_egrantz,2)
-                            #print(f"Mess bill of {student} is {mess_bill}")
-                            sum += mess_bill
-                            student_bill = StudentBill(bill_id=bill_id,name=student,total=mess_bill,month=month,year=year)
-                            student_bill.save()
-                    print(f"Sum: {sum}")
-
-                    return redirect('view_monthly_bill',month,year)
+                    return redirect(f"{reverse('generate_mess_bill')}?job={job.id}")
             else:
                 messages.error(request,f"Attendance has not been taken between {start_date} and {end_date}")
         else:
             messages.error(request, "Make sure your entries are correct.")
     else:
         form = BillForm()
-    return render(request, "hostel/billform.html", {'form': form})
+    job = Job.objects.filter(id=request.GET.get('job'), kind='generate_bill').first() if request.GET.get('job', '').isdigit() else None
+    return render(request, "hostel/billform.html", {'form': form, 'job': job})
+
+@group_required('warden', login_url='access_denied')
+def job_status(request, job_id):
+    job = get_object_or_404(Job, id=job_id)
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+    }
+    if job.kind == 'generate_bill' and job.status == 'done':
+        data['url'] = reverse('view_monthly_bill', args=[job.result['month'], job.result['year']])
+    elif job.kind == 'import_students' and job.status == 'done':
+        data['url'] = f"{reverse('import_students')}?job={job.id}"
+    return JsonResponse(data)
 
 @group_required('warden', login_url='access_denied')
 def delete_bill(request, pk):
@@ -635,18 +645,13 @@ def delete_bill(request, pk):
 @group_required('warden', login_url='access_denied')
 def total_bill(request):
     try:
-        bill_filter = monthbillFilter(request.GET, queryset=MessBill.objects.all().order_by('-id'))
+        bill_filter = monthbillFilter(request.GET, queryset=MessBill.objects.select_related('summary'))
         bill_list = bill_filter.qs
 
-        paginator = Paginator(bill_list, 10)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        paginator = KeysetPaginator(bill_list, ['-id'], 10)
+        page_obj = paginator.get_page_from_request(request)
 
-        query_params = request.GET.copy()
-        if 'page' in query_params:
-            query_params.pop('page')
-
-        return render(request, "hostel/totalbill.html", {'filter': bill_filter, 'page_obj': page_obj, 'query_params': query_params})
+        return render(request, "hostel/totalbill.html", {'filter': bill_filter, 'page_obj': page_obj, 'query_params': query_params(request)})
     except Exception:
         return render(request, 'hostel/error.html')
 
@@ -655,34 +660,75 @@ def view_monthly_bill(request,month,year):
     try:
         current_month = month
         current_year = year
+        period = period_key(current_year, current_month)
+
+        # one ordered query, E-Grantz students first, split into the two groups in a single pass.
+        # The status is the one stored with the bill, like in the bill summary
+        bills = billed_e_grantz(StudentBill.objects.filter(period=period)).select_related('name').only(
+            'total','month','year','period','e_grantz','name__name','name__E_Grantz')
+        paginator = KeysetPaginator(bills, ['-billed_e_grantz','name__name','id'], 100)
+        page_obj = paginator.get_page_from_request(request)
+
+        true_bills = []
+        false_bills = []
+        for bill in page_obj:
+            (true_bills if bill.billed_e_grantz else false_bills).append(bill)
+
+        subtotals = billed_e_grantz(StudentBill.objects.filter(period=period)).aggregate(
+            e_grantz_total=models.Sum('total',filter=models.Q(billed_e_grantz=True)),
+            e_grantz_count=models.Count('id',filter=models.Q(billed_e_grantz=True)),
+            non_e_grantz_total=models.Sum('total',filter=models.Q(billed_e_grantz=False)),
+            non_e_grantz_count=models.Count('id',filter=models.Q(billed_e_grantz=False)),
+        )
 
-        students = Student.objects.all()
-
-        e_grantz_students = students.filter(E_Grantz=True)
-        non_e_grantz_students = students.filter(E_Grantz=False)
-
-        true_bills = StudentBill.objects.filter(month=current_month,year=current_year,name__in=e_grantz_students).select_related('name')
-        false_bills = StudentBill.objects.filter(month=current_month,year=current_year,name__in=non_e_grantz_students).select_related('name')
-
-        return render(request,"hostel/month_bill.html",{'true_bills':true_bills,'false_bills':false_bills})
+        return render(request,"hostel/month_bill.html",{
+            'true_bills':true_bills,
+            'false_bills':false_bills,
+            'subtotals':subtotals,
+            'page_obj':page_obj,
+            'month':current_month,
+            'year':current_year
+        })
     except Exception:
         return render(request,'hostel/error.html')
 
+@group_required('warden', login_url='access_denied')
+def export_monthly_bill(request,month,year,fmt):
+    if fmt not in ('csv','xlsx') or month not in MONTH_NUMBERS:
+        raise Http404
+    header = ['Admission No','Name','E-Grantz','Month','Year','Amount']
+    bills = billed_e_grantz(StudentBill.objects.filter(period=period_key(year,month))).order_by('name__name')
+    columns = ('name__admn_no','name__name','billed_e_grantz','month','year','total')
+    sheets = [
+        ('With E-Grantz', header, bills.filter(billed_e_grantz=True).values_list(*columns).iterator(chunk_size=2000)),
+        ('Without E-Grantz', header, bills.filter(billed_e_grantz=False).values_list(*columns).iterator(chunk_size=2000)),
+    ]
+    return export_response(fmt, f"bills-{month}-{year}", sheets)
+
+@group_required('warden', login_url='access_denied')
+def export_total_bill(request,fmt):
+    if fmt not in ('csv','xlsx'):
+        raise Http404
+    header = ['Month','Year','Students','Working Days','Mess Amount','Room Rent','Electricity Bill','Staff Salary','Total']
+    bills = monthbillFilter(request.GET, queryset=MessBill.objects.all().order_by('-id')).qs.values_list(
+        'month','year','no_of_students','mess_days','mess_amount','room_rent','electricity_bill','staff_salary','total')
+    return export_response(fmt, "mess-bills", [('Mess Bills', header, bills.iterator(chunk_size=2000))])
+
+@query_budget(QUERY_BUDGETS['streak'])
 @login_required()
 def streak(request):
     try:
-        streak_filter = streakFilter(request.GET, queryset=ContinuousAbsence.objects.all().select_related('name').order_by('-id'))
+        streak_filter = streakFilter(request.GET, queryset=ContinuousAbsence.objects.select_related('name').only(
+            'streak', 'month', 'year', 'period', 'name__name'))
         streak_list = streak_filter.qs
 
-        paginator = Paginator(streak_list, 6)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        paginator = KeysetPaginator(streak_list, ['-id'], 6)
+        page_obj = paginator.get_page_from_request(request)
 
-        # Get the query parameters as a dictionary
-        query_params = request.GET.copy()
-        if 'page' in query_params:
-            query_params.pop('page')
+        # runs that already qualify for a reduction, read from the maintained streak table
+        ongoing = (AbsenceStreak.objects.filter(length__gte=MIN_STREAK).select_related('name')
+                   .only('start_date', 'last_date', 'length', 'name__name').order_by('-last_date')[:10])
 
-        return render(request, "hostel/streak.html", {'filter': streak_filter, 'page_obj': page_obj, 'query_params': query_params})
+        return render(request, "hostel/streak.html", {'filter': streak_filter, 'page_obj': page_obj, 'query_params': query_params(request), 'ongoing': ongoing})
     except Exception:
         return render(request, 'hostel/error.html')